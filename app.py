@@ -1,10 +1,14 @@
 import gradio as gr
-import json
 import os
+import threading
 from dotenv import load_dotenv
 from configparser import ConfigParser
-from onboarding import RepoOnboarder
-from ragchatbot import RAGChatbot
+from onboarding_jobs import OnboardingJobs
+from repo_registry import RepoRegistry
+from federated_search import FederatedSearch
+from model_registry import warm_up
+from chatbot_pool import ChatbotPool
+from metrics import start_metrics_server
 
 # Load environment variables
 load_dotenv()
@@ -15,71 +19,172 @@ os.environ["GOOGLE_API_KEY"] = api_key
 configur = ConfigParser()
 configur.read('config.ini')
 registry_file = configur['files'].get('registry_file')
+# migrates registry_file into the SQLite registry the first time
+registry = RepoRegistry(configur['files'].get('registry_db', 'registry.sqlite'), legacy_json=registry_file)
+
+def warm_up_chat_stack(embedding_model, backend, model_cache):
+    """Import the chat modules and load the embedding model, off the startup path"""
+    import ragchatbot
+    warm_up(embedding_model, backend, model_cache)
+
+# The UI comes up without llama-index, Chroma or sentence-transformers, they are
+# imported on first use. Warm-up loads them in the background so the first repo
+# load doesn't wait on them.
+if configur['config'].getboolean('warm_up_model', False):
+    threading.Thread(
+        target=warm_up_chat_stack,
+        args=(
+            configur['config'].get('emebdding_model'),
+            configur['config'].get('embedding_backend', 'torch'),
+            configur['files'].get('model_cache', 'cache/models')
+        ),
+        daemon=True
+    ).start()
+
+# Live chatbots of recently used repos, so switching back to one is instant
+def create_chatbot(repo_name):
+    from ragchatbot import RAGChatbot
+    return RAGChatbot(chroma_path=f'chromadb/{repo_name}', collection_name=repo_name)
+
+chatbot_pool = ChatbotPool(
+    create_chatbot,
+    max_entries=configur['config'].getint('chatbot_pool_size', 4),
+    max_index_mb=configur['config'].getint('chatbot_pool_index_mb', 2048)
+)
+
+def on_repo_indexed(repo_info):
+    """A pooled chatbot of a re-indexed repo points at the old index, drop it from the pool"""
+    repo_name = repo_info['collection_name']
+    # the chatbot being chatted with stays open until load_repository replaces it
+    chatbot_pool.evict(repo_name, close=repo_name != current_repo)
+
+# Onboarding runs in background workers; the UI polls the job table
+onboarding_jobs = OnboardingJobs(
+    db_path=configur['files'].get('jobs_db', 'cache/jobs.sqlite'),
+    max_workers=configur['config'].getint('onboarding_workers', 2),
+    on_done=on_repo_indexed
+)
+
+# Search over every registered repo, its Chroma clients stay open between questions
+ALL_REPOS = "-- All Repositories --"
+federated_search = FederatedSearch(
+    registry,
+    embedding_model=configur['config'].get('emebdding_model'),
+    backend=configur['config'].get('embedding_backend', 'torch'),
+    model_cache=configur['files'].get('model_cache', 'cache/models'),
+    max_workers=configur['config'].getint('federated_workers', 8)
+)
+federated_chatbot = None
 
 # Global chatbot instance
 current_chatbot = None
 current_repo = None
 
-def load_registry():
-    """Load processed repos from registry"""
-    if os.path.exists(registry_file):
-        with open(registry_file, 'r') as f:
-            return json.load(f)
-    return {}
-
 def get_repo_list():
     """Get list of available repos"""
-    repos = load_registry()
-    return list(repos.keys())
+    return registry.names()
 
 def load_repository(repo_selection, new_repo_url):
     """Load or process repository"""
-    global current_chatbot, current_repo
+    global current_chatbot, current_repo, federated_chatbot
     
     try:
         # Determine which repo to use
-        if repo_selection and repo_selection != "-- Add New Repository --":
+        if repo_selection == ALL_REPOS:
+            if federated_chatbot is None:
+                from ragchatbot import RAGChatbot, FederatedRetriever
+                federated_chatbot = RAGChatbot(retriever=FederatedRetriever(federated_search, similarity_top_k=5))
+            current_chatbot = federated_chatbot
+            current_repo = ALL_REPOS
+            chatbot_pool.close_retired()
+            yield f"✓ Searching all {len(get_repo_list())} repositories.\n\nYou can now start chatting below.", gr.update(interactive=True)
+            return
+        elif repo_selection and repo_selection != "-- Add New Repository --":
             repo_name = repo_selection
             status_msg = f"Loading existing repository: {repo_name}"
         elif new_repo_url:
-            status_msg = f"Processing new repository: {new_repo_url}\n\nThis may take a few minutes..."
-            yield status_msg, gr.update(interactive=False)
-            
-            # Process new repo
-            onboarder = RepoOnboarder()
-            repo_info = onboarder.onboard(new_repo_url)
-            repo_name = repo_info['collection_name']
-            status_msg = f"✓ Repository '{repo_name}' processed successfully!"
+            # Process new repo in the background, progress shows up in the jobs panel
+            job_id = onboarding_jobs.submit(new_repo_url)
+            yield (
+                f"Onboarding job {job_id} started for {new_repo_url}\n\n"
+                "Follow its progress under Onboarding Jobs, the repository appears in the list when done."
+            ), gr.update(interactive=True)
+            return
         else:
             yield "⚠️ Please select a repository or enter a GitHub URL", gr.update(interactive=True)
             return
         
-        # Load chatbot
-        chroma_path = f'chromadb/{repo_name}'
-        current_chatbot = RAGChatbot(
-            chroma_path=chroma_path,
-            collection_name=repo_name
-        )
+        # Load chatbot (reused from the pool when the repo was opened recently)
+        current_chatbot = chatbot_pool.get(repo_name)
         current_repo = repo_name
+        # a re-indexed repo's old chatbot, kept open while it was current
+        chatbot_pool.close_retired()
         
-        final_msg = f"✓ Repository '{repo_name}' loaded successfully!\n\nYou can now start chatting below."
+        stats = chatbot_pool.get_stats()
+        final_msg = (
+            f"✓ Repository '{repo_name}' loaded successfully!\n\nYou can now start chatting below.\n\n"
+            f"Pool: {len(stats['repos'])} repos, {stats['index_mb']} MB of indexes, hit rate {stats['hit_rate']:.0%}"
+        )
         yield final_msg, gr.update(interactive=True)
         
     except Exception as e:
         yield f"❌ Error: {str(e)}", gr.update(interactive=True)
 
+def refresh_repository(repo_selection):
+    """Re-index the changed files of the selected repo in a background job"""
+    repo_info = registry.get(repo_selection) if repo_selection not in (None, ALL_REPOS, "-- Add New Repository --") else None
+    if repo_info is None:
+        return "⚠️ Please select a repository to refresh"
+    job_id = onboarding_jobs.submit(repo_info['url'], refresh=True)
+    return f"Refresh job {job_id} started for {repo_selection}\n\nFollow its progress under Onboarding Jobs."
+
 def chat_fn(message, history):
-    """Handle chat messages"""
+    """Handle chat messages, streaming the answer as it is generated"""
     global current_chatbot
     
     if current_chatbot is None:
-        return "⚠️ Please load a repository first using the panel above."
+        yield "⚠️ Please load a repository first using the panel above."
+        return
     
+    response = ""
     try:
-        response = current_chatbot.chat(message)
-        return response
+        for token in current_chatbot.stream_chat(message):
+            response += token
+            yield response
     except Exception as e:
-        return f"❌ Error: {str(e)}"
+        yield f"{response}\n\n❌ Error: {str(e)}" if response else f"❌ Error: {str(e)}"
+
+def format_job(job):
+    """One status line per job: stage counts and ETA"""
+    kind = "refresh" if job['refresh'] else "onboard"
+    parts = [f"{job['id']}  {job['repo_url'].split('/')[-1]}  {kind}  {job['status']}"]
+    for stage, state in job['progress'].items():
+        total = f"/{state['total']}" if state.get('total') else ""
+        parts.append(f"{stage} {state['done']}{total}")
+    if job['eta'] is not None:
+        parts.append(f"ETA {job['eta']:.0f}s")
+    if job['error']:
+        parts.append(f"error: {job['error']}")
+    return "  |  ".join(parts)
+
+_listed_repos = None
+
+def poll_jobs():
+    """Refresh the jobs panel, and the repo list once a job adds a repo"""
+    global _listed_repos
+    jobs_text = "\n".join(format_job(job) for job in onboarding_jobs.list_jobs(limit=10)) or "No onboarding jobs yet"
+    repos = get_repo_list()
+    if repos == _listed_repos:
+        return jobs_text, gr.update()
+    _listed_repos = repos
+    return jobs_text, gr.update(choices=["-- Add New Repository --", ALL_REPOS] + repos)
+
+def cancel_job(job_id):
+    """Cancel a queued or running onboarding job"""
+    job_id = (job_id or "").strip()
+    if onboarding_jobs.cancel(job_id):
+        return f"Cancelling job {job_id}..."
+    return f"⚠️ No active job with id '{job_id}'"
 
 def reset_chat():
     """Reset chat history"""
@@ -99,7 +204,7 @@ with gr.Blocks(title="RAG Code Chatbot", theme=gr.themes.Soft()) as demo:
             
             # Dropdown for existing repos
             repo_dropdown = gr.Dropdown(
-                choices=["-- Add New Repository --"] + get_repo_list(),
+                choices=["-- Add New Repository --", ALL_REPOS] + get_repo_list(),
                 label="Select Existing Repository",
                 value=None
             )
@@ -113,6 +218,7 @@ with gr.Blocks(title="RAG Code Chatbot", theme=gr.themes.Soft()) as demo:
             
             # Load button
             load_btn = gr.Button("Load Repository", variant="primary")
+            refresh_btn = gr.Button("Refresh Repository", variant="secondary")
             
             # Status output
             status_output = gr.Textbox(
@@ -123,6 +229,13 @@ with gr.Blocks(title="RAG Code Chatbot", theme=gr.themes.Soft()) as demo:
             
             # Reset chat button
             reset_btn = gr.Button("Reset Chat History", variant="secondary")
+
+            gr.Markdown("### ⏳ Onboarding Jobs")
+            jobs_output = gr.Textbox(label="Jobs", lines=5, interactive=False)
+            with gr.Row():
+                cancel_input = gr.Textbox(label="Job ID", lines=1, scale=2)
+                cancel_btn = gr.Button("Cancel Job", variant="secondary", scale=1)
+            jobs_timer = gr.Timer(2)
         
         with gr.Column(scale=2):
             gr.Markdown("### 💬 Chat Interface")
@@ -147,6 +260,23 @@ with gr.Blocks(title="RAG Code Chatbot", theme=gr.themes.Soft()) as demo:
         outputs=[status_output, load_btn]
     )
     
+    refresh_btn.click(
+        fn=refresh_repository,
+        inputs=repo_dropdown,
+        outputs=status_output
+    )
+
+    jobs_timer.tick(
+        fn=poll_jobs,
+        outputs=[jobs_output, repo_dropdown]
+    )
+
+    cancel_btn.click(
+        fn=cancel_job,
+        inputs=cancel_input,
+        outputs=status_output
+    )
+    
     reset_btn.click(
         fn=reset_chat,
         outputs=chatbot.chatbot
@@ -154,10 +284,14 @@ with gr.Blocks(title="RAG Code Chatbot", theme=gr.themes.Soft()) as demo:
     
     # Refresh dropdown when loading new repo
     load_btn.click(
-        fn=lambda: gr.update(choices=["-- Add New Repository --"] + get_repo_list()),
+        fn=lambda: gr.update(choices=["-- Add New Repository --", ALL_REPOS] + get_repo_list()),
         outputs=repo_dropdown
     )
 
 # Launch app
 if __name__ == "__main__":
+    # Prometheus-style /metrics of onboarding and chat stages on its own port, off when 0
+    metrics_port = configur['config'].getint('metrics_port', 0)
+    if metrics_port:
+        start_metrics_server(metrics_port)
     demo.launch()
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""Micro-benchmark for the chunkers on large generated files.
+
+Times chunk_python_code, chunk_markdown, chunk_text and chunk_json on inputs
+of growing size. With linear-time chunkers the time per MB stays flat as the
+input doubles; a quadratic chunker's time per MB doubles with it.
+
+Pass an embedding model name to size chunks with its tokenizer, which is
+where re-measuring growing strings used to hurt the most.
+
+Before timing, check_line_ranges makes sure the pieces of a method too large
+for one chunk report the source lines they were cut from.
+
+Usage: python -m benchmarks.bench_chunking [max_scale] [embedding_model]
+"""
+import sys
+import json
+import time
+
+from processing import chunk_python_code, chunk_markdown, chunk_text, chunk_json, set_tokenizer
+
+
+def make_python(scale):
+    """One huge class, many functions and lots of top-level statements"""
+    parts = ['"""Generated module."""', 'import os', '']
+    parts.append('class Generated:')
+    parts.append('    """A very large generated class."""')
+    for i in range(200 * scale):
+        parts.append(f'    def method_{i}(self, value):')
+        parts.append(f'        return value * {i} + len("{"x" * 40}")')
+        parts.append('')
+    for i in range(200 * scale):
+        parts.append(f'CONSTANT_{i} = {i}')
+        parts.append(f'def function_{i}(a, b):')
+        parts.append(f'    return a + b + {i}')
+        parts.append('')
+    return '\n'.join(parts)
+
+
+def make_markdown(scale):
+    """A single huge section made of many paragraphs"""
+    parts = ['# Generated', '']
+    for i in range(1000 * scale):
+        parts.append(f'Paragraph {i} ' + 'lorem ipsum dolor sit amet ' * 8)
+        parts.append('')
+    return '\n'.join(parts)
+
+
+def make_text(scale):
+    return '\n\n'.join(f'Line {i} ' + 'the quick brown fox jumps ' * 8 for i in range(1000 * scale))
+
+
+def make_json(scale):
+    return json.dumps({f'key_{i}': {'values': list(range(20)), 'name': f'item {i}'} for i in range(500 * scale)}, indent=2)
+
+
+def make_large_method(size=120):
+    """A class whose middle method alone is larger than a chunk"""
+    lines = ['class Large:', '    """A class with one huge method."""', '', '    def small(self):', '        return 1', '']
+    lines.append('    def huge(self, value):')
+    for i in range(size):
+        lines.append(f'        value = value * {i} + len("{"y" * 20}")  # step {i}')
+    lines.extend(['        return value', '', '    def after(self):', '        return 2'])
+    return '\n'.join(lines)
+
+
+def check_line_ranges(max_tokens=200):
+    """Every piece of the split method must equal its [start_line, end_line] source slice"""
+    content = make_large_method()
+    source_lines = content.split('\n')
+    pieces = [chunk for chunk in chunk_python_code(content, max_tokens) if not chunk['content'].startswith('class ')]
+    if len(pieces) < 2:
+        raise AssertionError(f"expected the huge method to be split, got {len(pieces)} piece(s)")
+    for chunk in pieces:
+        expected = '\n'.join(source_lines[chunk['start_line'] - 1:chunk['end_line']])
+        if chunk['content'] != expected:
+            raise AssertionError(f"piece at lines {chunk['start_line']}-{chunk['end_line']} does not match its source lines")
+    print(f"line ranges ok ({len(pieces)} pieces)")
+
+
+CASES = [
+    ("python", make_python, chunk_python_code),
+    ("markdown", make_markdown, chunk_markdown),
+    ("text", make_text, chunk_text),
+    ("json", make_json, chunk_json),
+]
+
+
+def time_call(fn, content, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = fn(content, 500)
+        best = min(best, time.perf_counter() - start)
+    return best, len(chunks)
+
+
+def main():
+    max_scale = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    if len(sys.argv) > 2:
+        set_tokenizer(sys.argv[2])
+    check_line_ranges()
+    print(f"{'chunker':<10}{'scale':>6}{'size MB':>10}{'chunks':>8}{'seconds':>10}{'s / MB':>10}")
+    for name, make, fn in CASES:
+        scale = 1
+        while scale <= max_scale:
+            content = make(scale)
+            size_mb = len(content) / 1e6
+            seconds, num_chunks = time_call(fn, content)
+            print(f"{name:<10}{scale:>6}{size_mb:>10.2f}{num_chunks:>8}{seconds:>10.4f}{seconds / size_mb:>10.4f}")
+            scale *= 2
+
+
+if __name__ == "__main__":
+    main()
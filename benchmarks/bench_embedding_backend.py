@@ -0,0 +1,73 @@
+"""Compare the ONNX and int8 embedding backends against the fp32 torch model.
+
+Chunks a directory (this repo by default) and encodes every chunk with each
+backend, reporting chunks per second, the speedup over torch, the cosine
+similarity between each chunk's vector and its fp32 vector, and how many of
+the fp32 top-10 neighbours of a sample of chunks each backend still returns.
+
+Models are exported and quantized into cache/models on first use.
+
+Usage: python -m benchmarks.bench_embedding_backend [repo_path] [max_chunks]
+"""
+import sys
+import time
+import numpy as np
+from configparser import ConfigParser
+
+from embedding_backend import BACKENDS, load_embedding_model
+from processing import UniversalChunker
+from benchmarks.fakes import sample_chunks
+
+
+def encode(model, documents, batch_size=64):
+    """Best-of-two wall time and unit-normalised embeddings"""
+    model.encode(documents[:batch_size], batch_size=batch_size)  # warm-up
+    best = float('inf')
+    for _ in range(2):
+        start = time.perf_counter()
+        vectors = model.encode(documents, batch_size=batch_size)
+        best = min(best, time.perf_counter() - start)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return best, vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def neighbour_overlap(reference, vectors, queries=100, k=10):
+    """Mean share of the reference top-k neighbours also found with vectors"""
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(reference), size=min(queries, len(reference)), replace=False)
+    overlap = 0.0
+    for i in sample:
+        expected = set(np.argsort(-(reference @ reference[i]))[:k])
+        found = set(np.argsort(-(vectors @ vectors[i]))[:k])
+        overlap += len(expected & found) / k
+    return overlap / len(sample)
+
+
+def main():
+    repo_path = sys.argv[1] if len(sys.argv) > 1 else '.'
+    max_chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    configur = ConfigParser()
+    configur.read('config.ini')
+    embedding_model = configur['config'].get('emebdding_model')
+    model_cache = configur['files'].get('model_cache', 'cache/models')
+
+    chunks = sample_chunks(repo_path, UniversalChunker(embedding_model=embedding_model))
+    documents = [chunk['content'] for chunk in chunks[:max_chunks]]
+    print(f"{embedding_model}: {len(documents)} chunks from {repo_path}\n")
+
+    print(f"{'backend':<12}{'seconds':>10}{'chunks/s':>10}{'speedup':>9}{'cos mean':>10}{'cos min':>9}{'top-10':>8}")
+    reference = None
+    for backend in BACKENDS:
+        model = load_embedding_model(embedding_model, backend, model_cache)
+        seconds, vectors = encode(model, documents)
+        if reference is None:
+            reference, baseline = vectors, seconds
+        cosine = np.sum(reference * vectors, axis=1)
+        overlap = neighbour_overlap(reference, vectors)
+        print(f"{backend:<12}{seconds:>10.2f}{len(documents) / seconds:>10.1f}{baseline / seconds:>8.2f}x"
+              f"{cosine.mean():>10.4f}{cosine.min():>9.4f}{overlap:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
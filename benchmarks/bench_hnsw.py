@@ -0,0 +1,195 @@
+"""Recall versus query latency of Chroma's HNSW settings.
+
+Chunks a synthetic repo (benchmarks.synthetic_repo) and builds a labelled
+query set from it: every chunk name and every Python docstring is a query,
+and the chunks carrying that name or docstring are the expected hits.
+Each combination of space, max_neighbors (M) and ef_construction gets its
+own collection built from the same vectors; ef_search is then swept on it
+at query time. Reported per setting:
+
+- label recall@k: share of queries with an expected chunk in the top k
+- ann recall@k: share of the top k scoring at least the exact k-th best
+  score (brute force), so ties with the k-th hit count as found
+- p50 / p99 latency of a single query, embeddings precomputed
+- build time and index size on disk
+
+The embedding model is a word-hash stub unless --model real is given, which
+uses the configured sentence-transformers model (downloaded on first use).
+
+Usage: python -m benchmarks.bench_hnsw [--files 300] [--k 5] [--spaces l2]
+           [--max-neighbors 8,16,32] [--ef-construction 50,100,200]
+           [--ef-search 10,20,50,100,200] [--min-recall 0.95] [--model hash|real]
+"""
+import os
+import re
+import json
+import argparse
+import tempfile
+import time
+from configparser import ConfigParser
+
+import chromadb
+import numpy as np
+
+from benchmarks.fakes import HashEmbeddingModel, sample_chunks
+from benchmarks.synthetic_repo import generate_repo
+from chatbot_pool import index_disk_size
+from hnsw_config import open_collection
+
+DOCSTRING = re.compile(r'"""(.+?)"""', re.S)
+ADD_BATCH = 1000
+
+
+class WordHashEmbeddingModel(HashEmbeddingModel):
+    """HashEmbeddingModel over lowercased word tokens, so `foo_bar(a,` and `foo_bar` share a token"""
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        return super().encode([' '.join(re.findall(r'\w+', s.lower())) for s in sentences], batch_size, **kwargs)
+
+
+def labelled_queries(chunks):
+    """{query text: indices of the chunks it should find} from chunk names and Python docstrings"""
+    queries = {}
+    for i, chunk in enumerate(chunks):
+        if chunk.get('name'):
+            queries.setdefault(chunk['name'], set()).add(i)
+        if chunk.get('file_extension') == '.py':
+            for match in DOCSTRING.finditer(chunk['content']):
+                if match.group(1).strip():
+                    queries.setdefault(match.group(1).strip(), set()).add(i)
+    return queries
+
+
+def kth_best_scores(vectors, query_vectors, k):
+    """Exact k-th best cosine similarity per query (the vectors are normalised, so l2 and ip agree)"""
+    scores = query_vectors @ vectors.T
+    return np.partition(scores, -k, axis=1)[:, -k]
+
+
+def build_collection(path, settings, vectors, documents):
+    client = chromadb.PersistentClient(path=path)
+    collection = open_collection(client, 'bench', settings)
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), ADD_BATCH):
+        collection.add(
+            ids=[str(i) for i in range(offset, min(offset + ADD_BATCH, len(vectors)))],
+            embeddings=vectors[offset:offset + ADD_BATCH].tolist(),
+            documents=documents[offset:offset + ADD_BATCH]
+        )
+    return client, collection, time.perf_counter() - start
+
+
+def evaluate(collection, vectors, query_vectors, expected, kth_best, k):
+    latencies = []
+    label_hits = 0
+    overlap = 0
+    for query_vector, targets, threshold in zip(query_vectors, expected, kth_best):
+        start = time.perf_counter()
+        results = collection.query(query_embeddings=[query_vector.tolist()], n_results=k, include=[])
+        latencies.append(time.perf_counter() - start)
+        found = [int(chunk_id) for chunk_id in results['ids'][0]]
+        label_hits += bool(targets.intersection(found))
+        overlap += int(np.sum(vectors[found] @ query_vector >= threshold - 1e-6))
+    latencies = np.array(latencies) * 1000
+    return {
+        'label_recall': label_hits / len(expected),
+        'ann_recall': overlap / (len(expected) * k),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--spaces', default='l2')
+    parser.add_argument('--max-neighbors', type=int_list, default=[8, 16, 32])
+    parser.add_argument('--ef-construction', type=int_list, default=[50, 100, 200])
+    parser.add_argument('--ef-search', type=int_list, default=[10, 20, 50, 100, 200])
+    parser.add_argument('--min-recall', type=float, default=0.95)
+    parser.add_argument('--model', choices=('hash', 'real'), default='hash')
+    parser.add_argument('--output', default='benchmarks/results/hnsw.json')
+    args = parser.parse_args()
+
+    if args.model == 'real':
+        from model_registry import get_embedding_model
+        configur = ConfigParser()
+        configur.read('config.ini')
+        model = get_embedding_model(
+            configur['config'].get('emebdding_model'),
+            configur['config'].get('embedding_backend', 'torch'),
+            configur['files'].get('model_cache', 'cache/models')
+        )
+    else:
+        # as wide as mpnet's vectors, fewer hash collisions between identifiers
+        model = WordHashEmbeddingModel(dim=768)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workspace:
+        generate_repo(os.path.join(workspace, 'src'), files=args.files, seed=args.seed)
+        chunks = sample_chunks(os.path.join(workspace, 'src'))
+        vectors = np.asarray(model.encode([chunk['content'] for chunk in chunks], batch_size=64), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        # the stub gives chunks without a single word a zero vector, nearest to everything under l2
+        keep = norms > 0
+        chunks = [chunk for chunk, kept in zip(chunks, keep) if kept]
+        vectors = vectors[keep] / norms[keep, None]
+        documents = [chunk['content'] for chunk in chunks]
+        queries = list(labelled_queries(chunks).items())
+        print(f"{len(chunks)} chunks, {len(queries)} labelled queries, k={args.k}")
+
+        query_vectors = np.asarray(model.encode([q for q, _ in queries], batch_size=64), dtype=np.float32)
+        query_vectors /= np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+        expected = [targets for _, targets in queries]
+        kth_best = kth_best_scores(vectors, query_vectors, args.k)
+
+        print(f"\n{'space':<7}{'M':>4}{'ef_c':>6}{'build s':>9}{'size MB':>9}{'ef_s':>6}"
+              f"{'label@k':>9}{'ann@k':>8}{'p50 ms':>8}{'p99 ms':>8}")
+        for space in args.spaces.split(','):
+            for max_neighbors in args.max_neighbors:
+                for ef_construction in args.ef_construction:
+                    path = os.path.join(workspace, f'{space}-{max_neighbors}-{ef_construction}')
+                    settings = {'space': space, 'max_neighbors': max_neighbors, 'ef_construction': ef_construction}
+                    client, collection, build_seconds = build_collection(path, settings, vectors, documents)
+                    client.close()
+                    size_mb = index_disk_size(path) / 1024 / 1024
+                    for ef_search in args.ef_search:
+                        # Chroma applies ef_search when it loads the index, so reopen for each value
+                        client = chromadb.PersistentClient(path=path)
+                        collection = open_collection(client, 'bench', {'ef_search': ef_search})
+                        # one untimed query so the index is loaded before measuring
+                        collection.query(query_embeddings=[query_vectors[0].tolist()], n_results=args.k, include=[])
+                        row = {**settings, 'ef_search': ef_search, 'build_seconds': build_seconds}
+                        row.update(evaluate(collection, vectors, query_vectors, expected, kth_best, args.k))
+                        rows.append(row)
+                        client.close()
+                    for row in rows[-len(args.ef_search):]:
+                        row['size_mb'] = size_mb
+                        print(f"{space:<7}{max_neighbors:>4}{ef_construction:>6}{build_seconds:>9.2f}{size_mb:>9.1f}"
+                              f"{row['ef_search']:>6}{row['label_recall']:>9.3f}{row['ann_recall']:>8.3f}"
+                              f"{row['p50_ms']:>8.2f}{row['p99_ms']:>8.2f}")
+
+    good = [row for row in rows if row['ann_recall'] >= args.min_recall]
+    if good:
+        best = min(good, key=lambda row: row['p50_ms'])
+        print(f"\nFastest setting with ann recall@{args.k} >= {args.min_recall}: "
+              f"space={best['space']} max_neighbors={best['max_neighbors']} "
+              f"ef_construction={best['ef_construction']} ef_search={best['ef_search']} "
+              f"({best['p50_ms']:.2f} ms p50, {best['ann_recall']:.3f} recall)")
+    else:
+        print(f"\nNo setting reached ann recall@{args.k} >= {args.min_recall}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'chunks': len(chunks), 'queries': len(queries), 'k': args.k, 'results': rows}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
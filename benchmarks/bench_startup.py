@@ -0,0 +1,76 @@
+"""Cold-start time of the entry points and the modules that dominate it.
+
+Each target is imported in a fresh interpreter with -X importtime, so no
+module is cached between runs. For main.py the clock stops when the repo
+prompt is printed (stdin is closed, it exits right after). The slowest
+imports by cumulative time are listed for the last run of each target.
+
+Usage: python -m benchmarks.bench_startup [repeats] [top]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TARGETS = {
+    'main': [sys.executable, '-X', 'importtime', 'main.py'],
+    'app': [sys.executable, '-X', 'importtime', '-c', 'import app'],
+    'ragchatbot': [sys.executable, '-X', 'importtime', '-c', 'import ragchatbot'],
+    'onboarding': [sys.executable, '-X', 'importtime', '-c', 'import onboarding'],
+}
+PROMPT = 'Please select existing repository'
+
+
+def run_target(command):
+    """Wall seconds until the target is ready, and its -X importtime report"""
+    env = dict(os.environ, GOOGLE_API_KEY=os.environ.get('GOOGLE_API_KEY', 'bench'), PYTHONUNBUFFERED='1')
+    # the importtime report goes to a file, a stderr pipe nobody reads would fill up and block the target
+    with tempfile.TemporaryFile('w+') as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr, text=True, env=env
+        )
+        ready = None
+        for line in process.stdout:
+            if PROMPT in line:
+                ready = time.perf_counter() - start
+                break
+        process.stdout.read()
+        process.wait()
+        if ready is None:
+            ready = time.perf_counter() - start
+        stderr.seek(0)
+        return ready, stderr.read()
+
+
+def slowest_imports(importtime_report, top):
+    """(cumulative seconds, module) of the top-level-most slow imports"""
+    imports = []
+    for line in importtime_report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1e6, name.rstrip()))
+    # the target and the modules it imports directly, not their own dependencies
+    first_level = [(seconds, name.strip()) for seconds, name in imports if len(name) - len(name.lstrip()) <= 3]
+    return sorted(first_level, reverse=True)[:top]
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    for target, command in TARGETS.items():
+        times = []
+        for _ in range(repeats):
+            seconds, report = run_target(command)
+            times.append(seconds)
+        print(f"{target}: median {statistics.median(times):.2f}s, min {min(times):.2f}s over {repeats} runs")
+        for seconds, name in slowest_imports(report, top):
+            print(f"    {seconds:>7.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
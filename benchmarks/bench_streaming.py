@@ -0,0 +1,63 @@
+"""Time-to-first-token of RAGChatbot.chat versus RAGChatbot.stream_chat.
+
+Builds a small collection with the hash embedding stub and answers with
+FakeStreamingLLM, so the numbers only reflect the chat pipeline: a blocking
+chat call shows its first token when the whole answer is done, stream_chat
+as soon as the LLM emits it.
+
+Usage: python -m benchmarks.bench_streaming [num_tokens] [token_delay]
+"""
+import sys
+import tempfile
+import time
+from configparser import ConfigParser
+
+from benchmarks.fakes import HashEmbeddingModel, FakeStreamingLLM, sample_chunks
+from model_registry import register_embedding_model
+from processing import VectorStore
+from ragchatbot import RAGChatbot
+
+QUESTIONS = [
+    "How are chunk sizes computed?",
+    "Where are embeddings cached?",
+    "How does the lexical index rank results?",
+]
+
+
+def main():
+    num_tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    token_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+
+    configur = ConfigParser()
+    configur.read('config.ini')
+    embedding_model = configur['config'].get('emebdding_model')
+    register_embedding_model(embedding_model, HashEmbeddingModel(), configur['config'].get('embedding_backend', 'torch'))
+
+    with tempfile.TemporaryDirectory() as chroma_path:
+        store = VectorStore('bench', chroma_path, embedding_model, backend=configur['config'].get('embedding_backend', 'torch'))
+        store.add_chunks(sample_chunks('.'))
+
+        llm = FakeStreamingLLM(num_tokens=num_tokens, token_delay=token_delay)
+        chatbot = RAGChatbot(chroma_path=chroma_path, collection_name='bench', llm=llm)
+
+        print(f"{'mode':<12}{'first token s':>15}{'total s':>10}")
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            chatbot.chat(question)
+            total = time.perf_counter() - start
+            print(f"{'chat':<12}{total:>15.3f}{total:>10.3f}")
+
+            start = time.perf_counter()
+            first = None
+            for _ in chatbot.stream_chat(question):
+                if first is None:
+                    first = time.perf_counter() - start
+            total = time.perf_counter() - start
+            print(f"{'stream_chat':<12}{first:>15.3f}{total:>10.3f}")
+
+        assert len(chatbot.get_history()) == 2 * len(QUESTIONS)
+        chatbot.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Offline end-to-end benchmark suite with a stored baseline.
+
+Generates a synthetic git repo (benchmarks.synthetic_repo), then times
+ingestion.ingest, UniversalChunker.chunk_directory, VectorStore.add_chunks,
+VectorStore.search and RAGChatbot.chat. The embedding model is the hash stub
+and the LLM the fake from benchmarks.fakes, so nothing is downloaded and the
+numbers only reflect repochat's own code. Each stage runs `repeats` times;
+the median and the fastest run are kept.
+
+Results are written as JSON to --output and compared with --baseline: a stage
+whose fastest run is slower than the baseline's by more than --tolerance is a
+regression and the
+exit status is 1. The same workload (files, mix, seed) must also produce the
+same file, chunk, query and turn counts; a changed count is reported as a
+regression too. --update-baseline stores the current results as the new baseline.
+
+Usage: python -m benchmarks.bench_suite [--files 200] [--mix py=45,md=15,js=15,json=10,txt=15]
+           [--seed 0] [--repeats 3] [--output benchmarks/results/latest.json]
+           [--baseline benchmarks/baseline.json] [--tolerance 0.25] [--update-baseline]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import time
+from configparser import ConfigParser
+
+import metrics
+from benchmarks.fakes import HashEmbeddingModel, FakeStreamingLLM
+from benchmarks.synthetic_repo import DEFAULT_MIX, WORDS, generate_repo, parse_mix
+from model_registry import register_embedding_model
+from query_cache import query_embedding_cache, retrieval_cache
+
+CONFIG_FILE = os.path.abspath('config.ini')
+QUESTIONS = [
+    "How is the query cache updated?",
+    "Which function merges the search scores?",
+    "Where is the batch limit configured?",
+]
+CHAT_ROUNDS = 4
+
+
+def timed(fn, repeats):
+    """(median seconds, min seconds, last result) of calling fn repeats times"""
+    times = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times), result
+
+
+def run_suite(workspace, files, mix, seed, repeats):
+    from ingestion import ingestion
+    from processing import UniversalChunker, VectorStore
+    from ragchatbot import RAGChatbot
+
+    configur = ConfigParser()
+    configur.read(CONFIG_FILE)
+    embedding_model = configur['config'].get('emebdding_model')
+    backend = configur['config'].get('embedding_backend', 'torch')
+    register_embedding_model(embedding_model, HashEmbeddingModel(), backend)
+
+    remote = os.path.join(workspace, 'remote', 'synthetic')
+    generate_repo(remote, files=files, mix=mix, seed=seed)
+    repo_url = 'file://' + remote.replace('\\', '/')
+    results = {}
+
+    # ingestion clones into ./data, every repeat starts from an empty checkout
+    def ingest():
+        shutil.rmtree(os.path.join(workspace, 'data'), ignore_errors=True)
+        ingestor = ingestion(repo_url, max_workers=configur['config'].getint('metadata_workers', None))
+        ingestor.ingest()
+        return ingestor
+    median, best, ingestor = timed(ingest, repeats)
+    results['ingest'] = {'seconds': median, 'min_seconds': best, 'files': len(ingestor.metadata_list)}
+
+    chunker = UniversalChunker()
+    median, best, chunks = timed(lambda: chunker.chunk_directory(ingestor.dest_path), repeats)
+    results['chunk_directory'] = {'seconds': median, 'min_seconds': best, 'chunks': len(chunks)}
+
+    # a fresh collection per repeat, otherwise later runs only overwrite
+    store_paths = []
+    def add_chunks():
+        path = os.path.join(workspace, 'chroma', str(len(store_paths)))
+        store_paths.append(path)
+        store = VectorStore('bench', path, embedding_model, backend=backend)
+        store.add_chunks(chunks)
+        return store
+    median, best, store = timed(add_chunks, repeats)
+    results['add_chunks'] = {
+        'seconds': median, 'min_seconds': best, 'chunks': len(chunks),
+        'chunks_per_sec': len(chunks) / median if median else None
+    }
+
+    queries = [f'{first} {second}' for first in WORDS[:10] for second in WORDS[10:20]]
+    def search():
+        # cold caches, so every query really embeds and hits Chroma
+        query_embedding_cache.clear()
+        retrieval_cache.clear()
+        for query in queries:
+            store.search(query, n_results=5)
+    median, best, _ = timed(search, repeats)
+    results['search'] = {
+        'seconds': median, 'min_seconds': best, 'queries': len(queries),
+        'ms_per_query': median / len(queries) * 1000
+    }
+
+    llm = FakeStreamingLLM(num_tokens=20, first_token_delay=0.0, token_delay=0.0)
+    chatbot = RAGChatbot(chroma_path=store_paths[-1], collection_name='bench', config_file=CONFIG_FILE, llm=llm)
+    turns = QUESTIONS * CHAT_ROUNDS
+    def chat():
+        chatbot.reset()
+        for question in turns:
+            chatbot.chat(question)
+    median, best, _ = timed(chat, repeats)
+    results['chat'] = {
+        'seconds': median, 'min_seconds': best, 'turns': len(turns),
+        'ms_per_turn': median / len(turns) * 1000
+    }
+    chatbot.close()
+    store.lexical_index.close()
+    return results
+
+
+# counts that define the workload; timings are compared only when they match
+COUNT_FIELDS = ('files', 'chunks', 'queries', 'turns')
+
+
+def compare(current, baseline, tolerance):
+    """Print current vs baseline per stage; returns the names of regressed stages"""
+    if current['workload'] != baseline.get('workload'):
+        print(f"Baseline workload {baseline.get('workload')} differs from {current['workload']}, not comparing")
+        return []
+    regressions = []
+    print(f"\n{'stage':<18}{'baseline s':>12}{'current s':>12}{'change':>10}  (fastest runs)")
+    for stage, result in current['results'].items():
+        base = baseline['results'].get(stage)
+        if base is None:
+            print(f"{stage:<18}{'-':>12}{result['min_seconds']:>12.3f}{'new':>10}")
+            continue
+        for field in COUNT_FIELDS:
+            if field in result and result[field] != base.get(field):
+                print(f"  {stage}: {field} is {result[field]}, baseline has {base.get(field)}")
+                regressions.append(stage)
+        change = result['min_seconds'] / base['min_seconds'] - 1 if base['min_seconds'] else 0.0
+        flag = '  REGRESSION' if change > tolerance else ''
+        print(f"{stage:<18}{base['min_seconds']:>12.3f}{result['min_seconds']:>12.3f}{change:>+10.1%}{flag}")
+        if change > tolerance and stage not in regressions:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--mix', default=None, help="language mix, e.g. py=45,md=15,js=15,json=10,txt=15")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', default='benchmarks/results/latest.json')
+    parser.add_argument('--baseline', default='benchmarks/baseline.json')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    # stage events of the suite's own runs are not wanted in the app's metrics file
+    metrics.configure(events_file='', config_file=CONFIG_FILE)
+
+    cwd = os.getcwd()
+    # no 'repo' in the prefix: chunk_directory finds metadata.json by splitting the path on it
+    with tempfile.TemporaryDirectory(prefix='bench-suite-') as workspace:
+        os.chdir(workspace)
+        try:
+            results = run_suite(workspace, args.files, mix, args.seed, args.repeats)
+        finally:
+            os.chdir(cwd)
+
+    current = {
+        'workload': {'files': args.files, 'mix': {ext: round(share, 4) for ext, share in mix.items()}, 'seed': args.seed},
+        'repeats': args.repeats,
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.update_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline updated: {baseline_path}")
+        return
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}, run with --update-baseline to create one")
+        return
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\nNo stage regressed beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
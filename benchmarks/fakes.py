@@ -0,0 +1,78 @@
+"""Local stand-ins for the embedding model and Gemini used by the benchmarks.
+
+HashEmbeddingModel encodes like a SentenceTransformer without any weights,
+and FakeStreamingLLM answers with a fixed number of tokens after a start-up
+delay, so retrieval and streaming paths can be timed offline.
+sample_chunks chunks a source tree without needing an ingested metadata.json.
+"""
+import hashlib
+import os
+import time
+from typing import Any
+
+import numpy as np
+from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+SOURCE_EXTENSIONS = ('.py', '.md', '.txt', '.json', '.js', '.ts', '.go', '.java')
+SKIP_DIRS = {'.git', '__pycache__', 'node_modules', 'chromadb', 'cache', '.venv', 'venv'}
+
+
+def sample_chunks(root='.', chunker=None):
+    """Chunks of the source files under root, as UniversalChunker produces them"""
+    from processing import UniversalChunker
+    chunker = chunker or UniversalChunker()
+    chunks = []
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for name in sorted(files):
+            if name.endswith(SOURCE_EXTENSIONS):
+                path = os.path.join(dirpath, name)
+                chunks.extend(chunker.chunk_file(path, {'path': os.path.relpath(path, root)}))
+    return chunks
+
+
+class HashEmbeddingModel:
+    """Deterministic bag-of-words vectors with the SentenceTransformer encode interface"""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in sentence.split():
+                digest = hashlib.md5(word.encode('utf-8')).digest()
+                vectors[row, int.from_bytes(digest[:4], 'little') % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class FakeStreamingLLM(CustomLLM):
+    """LLM that waits first_token_delay, then emits num_tokens tokens token_delay apart"""
+    num_tokens: int = 50
+    first_token_delay: float = 0.3
+    token_delay: float = 0.02
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(num_output=self.num_tokens)
+
+    def _tokens(self):
+        return [f"token{i} " for i in range(self.num_tokens)]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.first_token_delay + self.token_delay * self.num_tokens)
+        return CompletionResponse(text=''.join(self._tokens()))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        def gen():
+            time.sleep(self.first_token_delay)
+            text = ''
+            for token in self._tokens():
+                time.sleep(self.token_delay)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+        return gen()
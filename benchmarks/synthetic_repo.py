@@ -0,0 +1,158 @@
+"""Deterministic synthetic git repositories for the benchmarks.
+
+generate_repo writes files of a configurable language mix under a directory
+and commits them with a fixed author and date, so the same seed always gives
+the same tree and commit. Clone it through a file:// URL like a remote repo.
+
+Usage: python -m benchmarks.synthetic_repo <path> [files] [mix] [seed]
+"""
+import os
+import sys
+import json
+import random
+
+import git
+
+# extension -> share of the files, used when no mix is given
+DEFAULT_MIX = {'.py': 0.45, '.md': 0.15, '.js': 0.15, '.json': 0.1, '.txt': 0.15}
+WORDS = (
+    'index chunk embed query vector token cache repo commit file batch model store search '
+    'parse scan update merge score rank filter config worker queue stream retry limit'
+).split()
+COMMIT_DATE = '2024-01-01T00:00:00'
+
+
+def parse_mix(spec):
+    """'py=50,md=20,js=30' -> {'.py': 0.5, '.md': 0.2, '.js': 0.3}"""
+    weights = {}
+    for item in spec.split(','):
+        ext, weight = item.split('=')
+        weights['.' + ext.strip().lstrip('.')] = float(weight)
+    total = sum(weights.values())
+    return {ext: weight / total for ext, weight in weights.items()}
+
+
+def _sentence(rng, length=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+
+def _identifier(rng):
+    return '_'.join(rng.sample(WORDS, 2))
+
+
+def make_python(rng, size):
+    lines = ['"""' + _sentence(rng).capitalize() + '."""', 'import os', '']
+    for i in range(size):
+        if rng.random() < 0.3:
+            lines.append(f'class {_identifier(rng).title().replace("_", "")}{i}:')
+            lines.append(f'    """{_sentence(rng)}"""')
+            for j in range(rng.randint(2, 6)):
+                lines.append(f'    def {_identifier(rng)}_{j}(self, value):')
+                lines.append(f'        # {_sentence(rng, 8)}')
+                lines.append(f'        return value * {j} + {i}')
+                lines.append('')
+        else:
+            lines.append(f'def {_identifier(rng)}_{i}(a, b):')
+            lines.append(f'    """{_sentence(rng)}"""')
+            for j in range(rng.randint(1, 8)):
+                lines.append(f'    a = a + b * {j}  # {_sentence(rng, 6)}')
+            lines.append('    return a')
+            lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def make_markdown(rng, size):
+    lines = ['# ' + _sentence(rng, 4).title(), '']
+    for i in range(size):
+        lines.append('## ' + _sentence(rng, 3).title())
+        lines.append('')
+        for _ in range(rng.randint(1, 4)):
+            lines.append(_sentence(rng, 40) + '.')
+            lines.append('')
+    return '\n'.join(lines)
+
+
+def make_javascript(rng, size):
+    lines = []
+    for i in range(size):
+        name = _identifier(rng).replace('_', '')
+        lines.append(f'function {name}{i}(a, b) {{')
+        for j in range(rng.randint(1, 8)):
+            lines.append(f'  a = a + b * {j}; // {_sentence(rng, 6)}')
+        lines.append('  return a;')
+        lines.append('}')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def make_json(rng, size):
+    data = {
+        _identifier(rng) + str(i): {'value': i, 'tags': rng.sample(WORDS, 3), 'note': _sentence(rng)}
+        for i in range(size * 4)
+    }
+    return json.dumps(data, indent=2)
+
+
+def make_text(rng, size):
+    return '\n\n'.join(_sentence(rng, 60) for _ in range(size)) + '\n'
+
+
+GENERATORS = {
+    '.py': make_python,
+    '.md': make_markdown,
+    '.js': make_javascript,
+    '.json': make_json,
+    '.txt': make_text,
+}
+
+
+def generate_repo(path, files=200, mix=None, seed=0, size=20, dirs=10):
+    """Write and commit `files` files under path; returns {extension: file count}.
+
+    mix maps an extension to its share of the files (DEFAULT_MIX when None),
+    size scales the number of definitions / sections per file.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    unknown = set(mix) - set(GENERATORS)
+    if unknown:
+        raise ValueError(f"No generator for {', '.join(sorted(unknown))}, expected {', '.join(GENERATORS)}")
+    extensions = list(mix)
+    weights = [mix[ext] for ext in extensions]
+
+    os.makedirs(path, exist_ok=True)
+    counts = {}
+    written = []
+    for i in range(files):
+        ext = rng.choices(extensions, weights)[0]
+        rel_path = f'pkg{i % dirs}/{_identifier(rng)}_{i}{ext}'
+        with _open_new(path, rel_path) as f:
+            f.write(GENERATORS[ext](rng, rng.randint(max(1, size // 2), size * 3 // 2)))
+        written.append(rel_path)
+        counts[ext] = counts.get(ext, 0) + 1
+
+    repo = git.Repo.init(path)
+    repo.index.add(written)
+    actor = git.Actor('Benchmark', 'bench@example.com')
+    repo.index.commit(
+        f'Synthetic repo: {files} files, seed {seed}',
+        author=actor, committer=actor, author_date=COMMIT_DATE, commit_date=COMMIT_DATE
+    )
+    return counts
+
+
+def _open_new(root, rel_path):
+    full_path = os.path.join(root, *rel_path.split('/'))
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    return open(full_path, 'w', encoding='utf-8', newline='\n')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    target = sys.argv[1]
+    num_files = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    file_mix = parse_mix(sys.argv[3]) if len(sys.argv) > 3 else None
+    repo_seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    print(generate_repo(target, num_files, file_mix, repo_seed))
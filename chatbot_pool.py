@@ -0,0 +1,114 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def index_disk_size(path):
+    """Bytes of a repo's Chroma and lexical index files on disk.
+
+    Used as a cheap proxy for what a loaded chatbot of the repo costs; it is
+    not measured resident memory (Chroma maps the index, SQLite pages in on demand).
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ChatbotPool:
+    """LRU pool of initialised per-repo chatbots.
+
+    Keeps up to max_entries chatbots (Chroma client, index and chat engine)
+    alive so switching back to a recently used repo skips the setup. Least
+    recently used chatbots are closed once either max_entries or
+    max_index_mb, the summed on-disk index size of the pooled repos, is
+    exceeded; the one just requested is always kept. Chatbots are built
+    outside the pool lock, so a slow load never blocks hits on other repos.
+    """
+
+    def __init__(self, factory, max_entries=4, max_index_mb=2048, chroma_root='chromadb'):
+        self.factory = factory
+        self.max_entries = max_entries
+        self.max_bytes = max_index_mb * 1024 * 1024
+        self.chroma_root = chroma_root
+        self._entries = OrderedDict()  # repo name -> (chatbot, index size in bytes)
+        self._retired = []  # evicted with close=False, closed by close_retired
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, repo_name):
+        """Chatbot for repo_name, created with factory on a miss"""
+        with self._lock:
+            if repo_name in self._entries:
+                self._entries.move_to_end(repo_name)
+                self.hits += 1
+                return self._entries[repo_name][0]
+            self.misses += 1
+
+        chatbot = self.factory(repo_name)
+        size = index_disk_size(os.path.join(self.chroma_root, repo_name))
+        with self._lock:
+            if repo_name in self._entries:
+                # built concurrently by another caller, keep the pooled one
+                self._entries.move_to_end(repo_name)
+                pooled, closing = self._entries[repo_name][0], [chatbot]
+            else:
+                self._entries[repo_name] = (chatbot, size)
+                pooled, closing = chatbot, self._evict_over_limits()
+        for stale in closing:
+            stale.close()
+        return pooled
+
+    def _evict_over_limits(self):
+        """Drop least recently used entries over the limits; returns their chatbots to close"""
+        evicted = []
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._index_bytes() > self.max_bytes
+        ):
+            _, (chatbot, _) = self._entries.popitem(last=False)
+            evicted.append(chatbot)
+            self.evictions += 1
+        return evicted
+
+    def _index_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def evict(self, repo_name, close=True):
+        """Drop a repo's chatbot, e.g. after it was re-onboarded.
+
+        Pass close=False for a chatbot that may still be in use; it is then
+        retired: removed from the pool so the next get builds a fresh one,
+        and closed by close_retired once the caller stopped using it.
+        """
+        with self._lock:
+            entry = self._entries.pop(repo_name, None)
+            if entry is not None and not close:
+                self._retired.append(entry[0])
+        if entry is not None and close:
+            entry[0].close()
+
+    def close_retired(self):
+        """Close the chatbots retired by evict(close=False)"""
+        with self._lock:
+            retired, self._retired = self._retired, []
+        for chatbot in retired:
+            chatbot.close()
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'repos': list(self._entries.keys()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'retired': len(self._retired),
+                'index_mb': round(self._index_bytes() / (1024 * 1024), 1)
+            }
@@ -0,0 +1,67 @@
+import os
+import platform
+
+# torch: fp32 PyTorch, onnx: exported ONNX graph, onnx-int8: dynamically quantized ONNX
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+def quantization_target():
+    """Instruction set the int8 model is quantized for on this machine"""
+    if platform.machine().lower() in ('arm64', 'aarch64'):
+        return 'arm64'
+    return 'avx2'
+
+
+def embedding_model_key(model_name, backend='torch'):
+    """Name embeddings are cached under; quantized vectors must not mix with fp32 ones"""
+    if backend == 'torch':
+        return model_name
+    return f'{model_name}@{backend}'
+
+
+def resolve_embedding_model(model_name, backend='torch', model_cache='cache/models'):
+    """Return (model path, SentenceTransformer kwargs) for backend.
+
+    The ONNX export and the int8 quantization run once and are kept under
+    model_cache, later loads read the converted files from there.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == 'torch':
+        return model_name, {}
+
+    try:
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            f"embedding_backend = {backend} needs optimum with onnxruntime: pip install 'optimum[onnxruntime]'"
+        ) from e
+    from sentence_transformers import SentenceTransformer
+    export_path = os.path.join(model_cache, model_name.replace('/', '--'))
+    if not os.path.exists(os.path.join(export_path, 'onnx', 'model.onnx')):
+        print(f"Exporting {model_name} to ONNX in {export_path}...")
+        SentenceTransformer(model_name, backend='onnx').save_pretrained(export_path)
+
+    if backend == 'onnx':
+        return export_path, {'backend': 'onnx'}
+
+    target = quantization_target()
+    file_name = f'onnx/model_qint8_{target}.onnx'
+    if not os.path.exists(os.path.join(export_path, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        print(f"Quantizing {model_name} to int8 ({target})...")
+        export_dynamic_quantized_onnx_model(
+            SentenceTransformer(export_path, backend='onnx'),
+            target,
+            export_path,
+            file_suffix=f'qint8_{target}'
+        )
+    return export_path, {'backend': 'onnx', 'model_kwargs': {'file_name': file_name}}
+
+
+def load_embedding_model(model_name, backend='torch', model_cache='cache/models'):
+    """SentenceTransformer for model_name running on the given backend"""
+    # imported here, sentence_transformers (and torch) take seconds to import
+    from sentence_transformers import SentenceTransformer
+    path, kwargs = resolve_embedding_model(model_name, backend, model_cache)
+    return SentenceTransformer(path, **kwargs)
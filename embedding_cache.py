@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+import numpy as np
+
+
+def content_hash(text):
+    """Hash used as the cache key for a chunk's content"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent content-addressed embedding cache backed by SQLite.
+
+    Embeddings are keyed on (model name, sha256 of chunk content), so the same
+    text is only encoded once per model across repos and re-onboards. Entries
+    are evicted least-recently-used once max_entries is exceeded.
+    """
+    # SQLite limit on bound parameters per statement is 999 on older builds
+    MAX_PARAMS = 900
+
+    def __init__(self, path, max_entries=2000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        # kept in memory so eviction does not need a COUNT(*) per write
+        self._count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, keys):
+        """Return {key: vector} for the keys present in the cache"""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), self.MAX_PARAMS):
+                part = keys[i:i + self.MAX_PARAMS]
+                placeholders = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                if rows:
+                    self.conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND content_hash IN ({','.join('?' * len(rows))})",
+                        [now, model, *(key for key, _ in rows)]
+                    )
+            self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model, items):
+        """Store (key, vector) pairs and evict the least recently used overflow"""
+        now = time.time()
+        rows = [(model, key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        with self._lock:
+            # same model and content always give the same vector, keep the existing row
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, content_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._count += cursor.rowcount
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            cursor = self.conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,)
+            )
+            self._count -= cursor.rowcount
+
+    def get_stats(self):
+        """Hit/miss counters for this process and number of stored entries"""
+        entries = self._count
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,130 @@
+import copy
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from processing import VectorStore
+from hnsw_config import collection_space, distance_to_similarity
+from query_cache import retrieval_cache
+
+
+class FederatedSearch:
+    """Vector search across every embedded repo in the RepoRegistry.
+
+    Each repo keeps its own VectorStore (Chroma client and collection), opened
+    on first use and kept warm across queries. The query is embedded once,
+    then all collections are queried concurrently, so latency follows the
+    slowest collection rather than the sum. Each collection's distances are
+    converted to a similarity according to its HNSW space (repos may use
+    different ones) and hits are merged by that score into a global top-k.
+    """
+
+    def __init__(self, registry, embedding_model, backend='torch', model_cache='cache/models', max_workers=8):
+        self.registry = registry
+        self.embedding_model = embedding_model
+        self.backend = backend
+        self.model_cache = model_cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='federated')
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def _load_registry(self):
+        """Repos ready to search, by name"""
+        return {entry['name']: entry for entry in self.registry.list_repos(status='Embedded')}
+
+    def _store(self, repo_name, repo_info):
+        """Warm VectorStore of a repo, opened on first use"""
+        with self._lock:
+            store = self._stores.get(repo_name)
+            if store is None:
+                store = VectorStore(
+                    collection_name=repo_info['collection_name'],
+                    persist_directory=repo_info['collection_path'],
+                    embedding_model=self.embedding_model,
+                    backend=self.backend,
+                    model_cache=self.model_cache
+                )
+                self._stores[repo_name] = store
+            return store
+
+    def _query(self, repo_name, store, query_embedding, n_results, filters):
+        results = store.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=filters
+        )
+        # raw distances of an l2 and a cosine collection must not be sorted against each other
+        space = collection_space(store.collection)
+        return [
+            {
+                'repo': repo_name,
+                'id': chunk_id,
+                'document': document,
+                'metadata': metadata,
+                'distance': distance,
+                'score': distance_to_similarity(distance, space)
+            }
+            for chunk_id, document, metadata, distance in zip(
+                results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]
+            )
+        ]
+
+    def search(self, query, n_results=5, repos=None, filters=None, repo_filters=None):
+        """Global top n_results hits across repos, highest score (similarity) first.
+
+        repos limits the search to the given repo names. filters is a Chroma
+        where clause applied to every repo; repo_filters maps a repo name to
+        a where clause used for that repo instead.
+        """
+        registry = self._load_registry()
+        names = [name for name in registry if repos is None or name in repos]
+        if not names:
+            return []
+        repo_filters = repo_filters or {}
+        stores = {name: self._store(name, registry[name]) for name in names}
+
+        # stale as soon as any searched repo is written to, by this or another process
+        cache_key = (
+            'federated',
+            tuple((name, stores[name].cache_version()) for name in names),
+            query,
+            json.dumps(filters, sort_keys=True),
+            json.dumps(repo_filters, sort_keys=True),
+            n_results
+        )
+        cached = retrieval_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        # embedded once (and cached) by the shared model, reused for every collection
+        query_embedding = stores[names[0]].embed_query(query)
+
+        futures = [
+            self._executor.submit(
+                self._query, name, stores[name], query_embedding, n_results, repo_filters.get(name, filters)
+            )
+            for name in names
+        ]
+        hits = []
+        failed = False
+        for name, future in zip(names, futures):
+            try:
+                hits.extend(future.result())
+            except Exception as e:
+                # one broken collection should not fail the whole search
+                print(f"Search in {name} failed: {e}")
+                failed = True
+        hits.sort(key=lambda hit: hit['score'], reverse=True)
+        hits = hits[:n_results]
+        if not failed:
+            retrieval_cache.put(cache_key, copy.deepcopy(hits))
+        return hits
+
+    def close(self):
+        """Release the warm clients and the worker threads"""
+        with self._lock:
+            for store in self._stores.values():
+                store.lexical_index.close()
+                if hasattr(store.client, 'close'):
+                    store.client.close()
+            self._stores.clear()
+        self._executor.shutdown(wait=False)
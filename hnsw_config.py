@@ -0,0 +1,66 @@
+from configparser import ConfigParser
+
+# HNSW settings of a Chroma collection. space, ef_construction and max_neighbors
+# (M) are fixed when the collection is created; ef_search can change any time.
+HNSW_CREATE_KEYS = ('space', 'ef_construction', 'max_neighbors', 'ef_search')
+HNSW_QUERY_KEYS = ('ef_search',)
+HNSW_SPACES = ('l2', 'cosine', 'ip')
+
+
+def hnsw_settings(collection_name=None, config_file='config.ini'):
+    """HNSW settings from the [hnsw] section, overridden by [hnsw.<collection_name>].
+
+    Keys left empty or absent are not returned, so Chroma's defaults apply.
+    """
+    configur = ConfigParser()
+    configur.read(config_file)
+    settings = {}
+    for section in ('hnsw', f'hnsw.{collection_name}'):
+        if not configur.has_section(section):
+            continue
+        for key in HNSW_CREATE_KEYS:
+            value = configur[section].get(key, '').strip()
+            if value:
+                settings[key] = value if key == 'space' else int(value)
+    if settings.get('space', 'l2') not in HNSW_SPACES:
+        raise ValueError(f"Unknown HNSW space '{settings['space']}', expected one of {', '.join(HNSW_SPACES)}")
+    return settings
+
+
+def collection_space(collection):
+    """Distance space a collection was created with, 'l2' unless set otherwise"""
+    hnsw = (collection.configuration or {}).get('hnsw') or {}
+    return hnsw.get('space') or (collection.metadata or {}).get('hnsw:space') or 'l2'
+
+
+def distance_to_similarity(distance, space):
+    """Cosine similarity a Chroma distance of the given space stands for, comparable across spaces.
+
+    Exact for normalised embeddings (sentence-transformers models normalise
+    theirs): Chroma's l2 is the squared distance 2 - 2cos, cosine and ip
+    distances are 1 - cos.
+    """
+    if space == 'l2':
+        return 1 - distance / 2
+    return 1 - distance
+
+
+def open_collection(client, collection_name, hnsw=None):
+    """get_or_create_collection with the given HNSW settings.
+
+    A new collection is created with all of them. An existing one keeps its
+    creation-time settings (changing those needs a re-index), only the
+    query-time ef_search is updated when it differs.
+    """
+    if not hnsw:
+        return client.get_or_create_collection(name=collection_name)
+    collection = client.get_or_create_collection(name=collection_name, configuration={'hnsw': dict(hnsw)})
+
+    current = (collection.configuration or {}).get('hnsw') or {}
+    query_settings = {key: hnsw[key] for key in HNSW_QUERY_KEYS if key in hnsw and current.get(key) != hnsw[key]}
+    if query_settings:
+        collection.modify(configuration={'hnsw': query_settings})
+    fixed = [key for key in HNSW_CREATE_KEYS if key not in HNSW_QUERY_KEYS and key in hnsw and current.get(key) != hnsw[key]]
+    if fixed:
+        print(f"Collection '{collection_name}' was created with other {', '.join(fixed)}; re-index it to apply them")
+    return collection
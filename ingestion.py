@@ -1,19 +1,32 @@
 import git
 import os
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import json
+import metrics
+
+# bytes considered printable by the binary heuristic
+TEXT_CHARS = bytes(range(32, 127)) + b"\n\r\t\b"
+# .gitattributes attributes GitHub's linguist uses to mark generated and third-party code
+LINGUIST_ATTRIBUTES = ('linguist-generated', 'linguist-vendored')
 
 class ingestion():
-    def __init__(self, repo_url):
+    def __init__(self, repo_url, max_workers=None, shallow=False, branch=None, progress=None):
         if os.getcwd().split('\\')[-1] == 'ingestion':
             self.root = os.path.abspath('..').replace('\\', '/')
         else:
             self.root = os.path.abspath('.').replace('\\', '/')
         self.repo_url = repo_url 
+        self.max_workers = max_workers
+        self.shallow = shallow
+        self.branch = branch
+        # optional progress(stage, done, total) callback
+        self.progress = progress
         self.repo_name = repo_url.split('/')[-1]
         print(f"Repo_name: {self.repo_name}")
         self.dest_path = self.root + "/data/" + self.repo_name + '/repo'
+        self.metadata_path = self.dest_path.split('repo')[0] + 'metadata.json'
 
         self.EXTENSION_TO_LANGUAGE = {
             ".py": "python",
@@ -43,10 +56,83 @@ class ingestion():
 
     def clone_repo(self, repo_url):
         try:
-            git.Repo.clone_from(repo_url, self.dest_path)
-            print(f"Repository successfully cloned to: {self.dest_path}")
+            if os.path.isdir(self.dest_path + '/.git'):
+                self.update_repo()
+                print(f"Repository successfully updated at: {self.dest_path}")
+            else:
+                kwargs = {}
+                if self.shallow:
+                    kwargs.update(depth=1, single_branch=True)
+                if self.branch:
+                    kwargs['branch'] = self.branch
+                git.Repo.clone_from(repo_url, self.dest_path, **kwargs)
+                print(f"Repository successfully cloned to: {self.dest_path}")
         except git.exc.GitCommandError as e:
+            # re-raised so onboarding marks the repo 'Failed' instead of indexing a missing or stale checkout
             print(f"Error cloning repository: {e}")
+            raise
+
+    def update_repo(self):
+        """Fetch the tracked branch into an existing checkout and check it out"""
+        repo = git.Repo(self.dest_path)
+        branch = self.branch
+        if branch is None:
+            branch = 'HEAD' if repo.head.is_detached else repo.active_branch.name
+        kwargs = {'depth': 1} if self.shallow else {}
+        repo.remotes.origin.fetch(branch, **kwargs)
+        repo.git.reset('--hard', 'FETCH_HEAD')
+
+    def head_commit(self):
+        """Sha of the checked out commit, None if it cannot be read"""
+        try:
+            return git.Repo(self.dest_path).head.commit.hexsha
+        except (ValueError, git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+            return None
+
+    def git_blob_ids(self):
+        """Map file path -> git blob id from the index of the checkout.
+
+        Files git does not track (or a non-git dest_path) are simply absent.
+        """
+        try:
+            output = git.Repo(self.dest_path).git.ls_files('-s', '-z')
+        except (git.exc.GitCommandError, git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+            return {}
+        blobs = {}
+        for entry in output.split('\0'):
+            if not entry:
+                continue
+            # "<mode> <blob> <stage>\t<path>"
+            info, path = entry.split('\t', 1)
+            blobs[self.dest_path + '/' + path] = info.split()[1]
+        return blobs
+
+    def git_hints(self, batch_size=1000):
+        """Map file path -> chunking hints from git: generated, vendored (.gitattributes) and ignored (.gitignore).
+
+        Only files with at least one hint are present; a non-git dest_path gives {}.
+        """
+        try:
+            repo = git.Repo(self.dest_path)
+            tracked = repo.git.ls_files('-z').split('\0')
+            # untracked files .gitignore excludes, e.g. build output left in a reused checkout
+            ignored = repo.git.ls_files('--others', '--ignored', '--exclude-standard', '-z').split('\0')
+        except (git.exc.GitCommandError, git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+            return {}
+        hints = {}
+        for path in ignored:
+            if path:
+                hints.setdefault(self.dest_path + '/' + path, {})['ignored'] = True
+
+        tracked = [path for path in tracked if path]
+        for start in range(0, len(tracked), batch_size):
+            output = repo.git.check_attr('-z', *LINGUIST_ATTRIBUTES, '--', *tracked[start:start + batch_size])
+            # "<path>\0<attribute>\0<value>\0" per path and attribute
+            fields = output.split('\0')
+            for path, attribute, value in zip(fields[0::3], fields[1::3], fields[2::3]):
+                if value in ('set', 'true'):
+                    hints.setdefault(self.dest_path + '/' + path, {})[attribute.split('-')[1]] = True
+        return hints
     
     def scan_files(self,exclude_dirs = {'node_modules', '.git', 'dist', 'build', '__pycache__', 'venv', '.venv'}):
         results = []
@@ -101,41 +187,154 @@ class ingestion():
             return None
 
 
-    def extract_metadata(self):
-        file_list = self.file_list
+    def file_stats(self, path, chunk_size=1 << 20, sample_size=1024):
+        """Compute sha256, binary flag and line count with a single read of the file"""
+        h = hashlib.sha256()
+        num_lines = 0
+        last_byte = b""
+        sample = None
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    if sample is None:
+                        sample = chunk[:sample_size]
+                    h.update(chunk)
+                    num_lines += chunk.count(b"\n")
+                    last_byte = chunk[-1:]
+        except (PermissionError, OSError):
+            # treat unreadable files as binary to avoid reading them
+            return None, True, None
+
+        # same count as iterating the file by lines: last line may lack a newline
+        if last_byte and last_byte != b"\n":
+            num_lines += 1
+
+        is_binary = False
+        if sample:
+            if b"\x00" in sample:
+                is_binary = True
+            # heuristic: high proportion of non-text bytes
+            elif len(sample.translate(None, TEXT_CHARS)) / len(sample) > 0.30:
+                is_binary = True
+        return h.hexdigest(), is_binary, num_lines
+
+    def _file_metadata(self, file, blobs, previous, hints):
+        rel_path = os.path.relpath(file, self.root).replace('\\', '/')
+        git_blob = blobs.get(file)
+        # .gitattributes / .gitignore can change without the file changing
+        file_hints = hints.get(file, {})
+        flags = {
+            "generated": file_hints.get('generated', False),
+            "vendored": file_hints.get('vendored', False),
+            "ignored": file_hints.get('ignored', False)
+        }
+
+        # unchanged blob: reuse the previous entry without reading the file
+        old = previous.get(rel_path)
+        if git_blob and old and old.get('git_blob') == git_blob and 'size' in old:
+            return {**old, **flags}
+
+        sha256, is_binary, num__lines = self.file_stats(file)
+        extension = self.get_language_from_extension(file)
+        try:
+            size = os.path.getsize(file)
+        except OSError:
+            size = None
+
+        return {
+            "filename": file.split('/')[-1],
+            "path": rel_path,
+            "sha256": sha256,
+            "git_blob": git_blob,
+            "is_binary": is_binary,
+            "language": extension,
+            "line_count": num__lines,
+            "size": size,
+            **flags
+        }
+
+    def extract_metadata(self, previous_metadata=()):
+        blobs = self.git_blob_ids()
+        hints = self.git_hints()
+        previous = {m['path']: m for m in previous_metadata}
+        # hashing releases the GIL, so a thread pool keeps the disk busy
         metadata_list = []
-        for file in file_list:
-            sha256 = self.compute_sha256(file)
-            is_binary = self.is_binary_file(file)
-            extension = self.get_language_from_extension(file)
-            num__lines = self.count_lines(file)
-            rel_path = os.path.relpath(file, self.root).replace('\\', '/')
-
-            metadata_list.append({
-                "filename": file.split('/')[-1],
-                "path": rel_path,
-                "sha256": sha256,
-                "is_binary": is_binary,
-                "language": extension,
-                "line_count": num__lines
-            })
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for metadata in executor.map(
+                lambda file: self._file_metadata(file, blobs, previous, hints),
+                self.file_list
+            ):
+                metadata_list.append(metadata)
+                # raises when the onboarding job was cancelled
+                self._report('metadata', len(metadata_list), len(self.file_list))
+        finally:
+            # on cancel, drop the files not started yet instead of hashing them all first
+            executor.shutdown(wait=True, cancel_futures=True)
         return metadata_list
+
+    def _report(self, stage, done, total=None):
+        if self.progress is not None:
+            self.progress(stage, done, total)
     
     def save_metadata(self):
         #os.makedirs(self.dest_path.split('repo')[0] + 'metadata', exist_ok = True)
-        output_path = self.dest_path.split('repo')[0] + 'metadata.json'
+        output_path = self.metadata_path
         print(f"Saving metadata at {output_path}")
         with open(output_path , "w", encoding="utf-8") as fh:
             json.dump(list(self.metadata_list), fh, ensure_ascii=False, indent=2)
 
+    def load_metadata(self):
+        """Load previously saved metadata.json, empty list if repo was never ingested"""
+        if not os.path.exists(self.metadata_path):
+            return []
+        with open(self.metadata_path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+
+    @staticmethod
+    def diff_metadata(old_metadata, new_metadata):
+        """Compare two metadata lists by path and git blob id (sha256 if either side has none).
+
+        Returns (added, changed, removed) where added/changed are metadata
+        entries from new_metadata and removed are entries from old_metadata.
+        """
+        old_by_path = {m['path']: m for m in old_metadata}
+        new_by_path = {m['path']: m for m in new_metadata}
+
+        added, changed = [], []
+        for path, meta in new_by_path.items():
+            if path not in old_by_path:
+                added.append(meta)
+                continue
+            old = old_by_path[path]
+            if old.get('git_blob') and meta.get('git_blob'):
+                is_changed = old['git_blob'] != meta['git_blob']
+            else:
+                is_changed = old['sha256'] != meta['sha256']
+            if is_changed:
+                changed.append(meta)
+        removed = [meta for path, meta in old_by_path.items() if path not in new_by_path]
+        return added, changed, removed
+
     def ingest(self):
         print(f'Cloning {self.repo_name}')
-        self.clone_repo(self.repo_url)
+        self._report('clone', 0, 1)
+        with metrics.stage('clone', repo=self.repo_name, shallow=self.shallow):
+            self.clone_repo(self.repo_url)
+        self._report('clone', 1, 1)
         print('Scanning files')
-        self.file_list = self.scan_files()
+        with metrics.stage('scan', repo=self.repo_name) as fields:
+            self.file_list = self.scan_files()
+            fields['files'] = len(self.file_list)
         print(f'Scanning files completed. Total {len(self.file_list)} files found')
         print('Extracting metadata for all files')
-        self.metadata_list = self.extract_metadata()
+        # kept so callers can diff against the previous ingestion
+        self.previous_metadata = self.load_metadata()
+        with metrics.stage('metadata', repo=self.repo_name, files=len(self.file_list)):
+            self.metadata_list = self.extract_metadata(self.previous_metadata)
         print("extraction of metadata completed")
         self.save_metadata()
 
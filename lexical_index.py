@@ -0,0 +1,273 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import time
+
+# chunk types whose 'name' is a code symbol worth an exact lookup
+SYMBOL_CHUNK_TYPES = {'function', 'class', 'class_part'}
+
+IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+WORD_RE = re.compile(r'[A-Za-z0-9_]+')
+# how long version() trusts its last read; writes of other processes show up within this
+VERSION_RECHECK_SECONDS = 1.0
+
+
+def identifiers_in(query):
+    """Tokens of a query that look like code identifiers rather than prose.
+
+    Backticked names, calls such as `run()` (no space before the '(') and
+    snake_case / camelCase tokens count; plain words such as 'where' or
+    'defined' do not, nor does prose like 'the work (in detail)'.
+    """
+    names = re.findall(r'`([A-Za-z_][A-Za-z0-9_.]*)`', query)
+    names += re.findall(r'([A-Za-z_][A-Za-z0-9_]*)\(', query)
+    for token in IDENTIFIER_RE.findall(query):
+        if '_' in token.strip('_') or re.search(r'[a-z][A-Z]', token):
+            names.append(token)
+    # dotted names (Class.method) are looked up by their last part
+    return list(dict.fromkeys(name.split('.')[-1] for name in names))
+
+
+def matches_filters(metadata, filters):
+    """Apply a flat equality filter such as {"language": "python"} to chunk metadata"""
+    if not filters:
+        return True
+    return all(metadata.get(key) == value for key, value in filters.items())
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked lists of ids into one list of (id, score), best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """Persistent symbol table and BM25 full-text index over chunk text.
+
+    Lives in a SQLite file next to the Chroma collection. Chunk text is
+    indexed with FTS5 (identifiers kept whole), and named functions and
+    classes are recorded in an indexed symbol table for exact lookups
+    without an embedding call.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # (version, monotonic time it was read), reset by this index's own writes
+        self._version = None
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                file_path TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_file_path ON chunks(file_path);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                document, content='chunks', content_rowid='id',
+                tokenize="unicode61 tokenchars '_'"
+            );
+            CREATE TABLE IF NOT EXISTS symbols (
+                name TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                UNIQUE (name, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_symbols_chunk_id ON symbols(chunk_id);
+            -- bumped by every write, so any process can tell its cached results are stale
+            CREATE TABLE IF NOT EXISTS write_version (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO write_version (id, version) VALUES (0, 0);
+
+            -- keep the full-text index and symbol table in sync with chunks
+            CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, document) VALUES (new.id, new.document);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, document) VALUES ('delete', old.id, old.document);
+                DELETE FROM symbols WHERE chunk_id = old.chunk_id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, document) VALUES ('delete', old.id, old.document);
+                INSERT INTO chunks_fts(rowid, document) VALUES (new.id, new.document);
+                DELETE FROM symbols WHERE chunk_id = old.chunk_id;
+            END;
+        """)
+        self._create_content_counters()
+        self.conn.commit()
+
+    def _create_content_counters(self):
+        """Chunk and distinct-content counters kept up to date by triggers, so stats never scan the index"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")]
+        if 'content_hash' not in columns:
+            # index written before the counters existed, hashes come from the stored metadata
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN content_hash TEXT")
+            self.conn.execute(
+                "UPDATE chunks SET content_hash = COALESCE(json_extract(metadata, '$.content_hash'), 'id:' || chunk_id)"
+            )
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS content_refs (
+                content_hash TEXT PRIMARY KEY,
+                refs INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunk_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                chunks INTEGER NOT NULL,
+                unique_contents INTEGER NOT NULL
+            );
+
+            CREATE TRIGGER IF NOT EXISTS chunks_ai_refs AFTER INSERT ON chunks BEGIN
+                INSERT INTO content_refs (content_hash, refs) VALUES (new.content_hash, 1)
+                    ON CONFLICT(content_hash) DO UPDATE SET refs = refs + 1;
+                UPDATE chunk_stats SET
+                    chunks = chunks + 1,
+                    unique_contents = unique_contents
+                        + ((SELECT refs FROM content_refs WHERE content_hash = new.content_hash) = 1);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad_refs AFTER DELETE ON chunks BEGIN
+                UPDATE content_refs SET refs = refs - 1 WHERE content_hash = old.content_hash;
+                UPDATE chunk_stats SET
+                    chunks = chunks - 1,
+                    unique_contents = unique_contents
+                        - ((SELECT refs FROM content_refs WHERE content_hash = old.content_hash) = 0);
+                DELETE FROM content_refs WHERE content_hash = old.content_hash AND refs = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_au_refs AFTER UPDATE OF content_hash ON chunks
+            WHEN old.content_hash IS NOT new.content_hash BEGIN
+                UPDATE content_refs SET refs = refs - 1 WHERE content_hash = old.content_hash;
+                UPDATE chunk_stats SET unique_contents = unique_contents
+                    - ((SELECT refs FROM content_refs WHERE content_hash = old.content_hash) = 0);
+                DELETE FROM content_refs WHERE content_hash = old.content_hash AND refs = 0;
+                INSERT INTO content_refs (content_hash, refs) VALUES (new.content_hash, 1)
+                    ON CONFLICT(content_hash) DO UPDATE SET refs = refs + 1;
+                UPDATE chunk_stats SET unique_contents = unique_contents
+                    + ((SELECT refs FROM content_refs WHERE content_hash = new.content_hash) = 1);
+            END;
+        """)
+        if self.conn.execute("SELECT 1 FROM chunk_stats").fetchone() is None:
+            # first open with counters: count what is already there, once
+            self.conn.execute("DELETE FROM content_refs")
+            self.conn.execute(
+                "INSERT INTO content_refs (content_hash, refs) SELECT content_hash, COUNT(*) FROM chunks GROUP BY content_hash"
+            )
+            self.conn.execute("""
+                INSERT INTO chunk_stats (id, chunks, unique_contents)
+                VALUES (0, (SELECT COUNT(*) FROM chunks), (SELECT COUNT(*) FROM content_refs))
+            """)
+
+    def add(self, ids, documents, metadatas):
+        """Insert or update chunks and record their symbols"""
+        rows = [
+            (chunk_id, metadata['file_path'], document, json.dumps(metadata), metadata.get('content_hash') or 'id:' + chunk_id)
+            for chunk_id, document, metadata in zip(ids, documents, metadatas)
+        ]
+        symbols = [
+            (metadata['name'], chunk_id)
+            for chunk_id, metadata in zip(ids, metadatas)
+            if metadata.get('name') and metadata.get('chunk_type') in SYMBOL_CHUNK_TYPES
+        ]
+        with self._lock:
+            self.conn.executemany("""
+                INSERT INTO chunks (chunk_id, file_path, document, metadata, content_hash) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(chunk_id) DO UPDATE SET
+                    file_path = excluded.file_path,
+                    document = excluded.document,
+                    metadata = excluded.metadata,
+                    content_hash = excluded.content_hash
+            """, rows)
+            self.conn.executemany("INSERT OR IGNORE INTO symbols (name, chunk_id) VALUES (?, ?)", symbols)
+            self.conn.execute("UPDATE write_version SET version = version + 1")
+            self.conn.commit()
+            self._version = None
+
+    def delete_files(self, file_paths):
+        """Drop all chunks (and their symbols) of the given files"""
+        with self._lock:
+            self.conn.executemany("DELETE FROM chunks WHERE file_path = ?", [(path,) for path in file_paths])
+            self.conn.execute("UPDATE write_version SET version = version + 1")
+            self.conn.commit()
+            self._version = None
+
+    def clear(self):
+        """Drop every chunk (triggers empty the full-text index, symbols and counters too)"""
+        with self._lock:
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.execute("UPDATE write_version SET version = version + 1")
+            self.conn.commit()
+            self._version = None
+
+    def lookup_symbols(self, names, filters=None):
+        """Chunks defining any of the given names, as dicts with id, document and metadata"""
+        hits = []
+        with self._lock:
+            for name in names:
+                rows = self.conn.execute("""
+                    SELECT c.chunk_id, c.document, c.metadata FROM symbols s
+                    JOIN chunks c ON c.chunk_id = s.chunk_id
+                    WHERE s.name = ?
+                """, (name,)).fetchall()
+                for chunk_id, document, metadata in rows:
+                    metadata = json.loads(metadata)
+                    if matches_filters(metadata, filters):
+                        hits.append({"id": chunk_id, "document": document, "metadata": metadata})
+        return hits
+
+    def search(self, query, n_results=5, filters=None):
+        """BM25 ranked chunks for the words of query, best first"""
+        words = WORD_RE.findall(query)
+        if not words:
+            return []
+        match = " OR ".join('"' + word + '"' for word in dict.fromkeys(words))
+        # over-fetch when filtering in python
+        limit = n_results * 4 if filters else n_results
+        with self._lock:
+            rows = self.conn.execute("""
+                SELECT c.chunk_id, c.document, c.metadata, bm25(chunks_fts) AS score
+                FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid
+                WHERE chunks_fts MATCH ?
+                ORDER BY score LIMIT ?
+            """, (match, limit)).fetchall()
+
+        hits = []
+        for chunk_id, document, metadata, score in rows:
+            metadata = json.loads(metadata)
+            if matches_filters(metadata, filters):
+                # bm25() is lower-is-better, flip it so higher is better
+                hits.append({"id": chunk_id, "document": document, "metadata": metadata, "score": -score})
+        return hits[:n_results]
+
+    def version(self, max_age=VERSION_RECHECK_SECONDS):
+        """Write counter of the index, shared by every process using the file.
+
+        Read from the file at most every max_age seconds, so checking it on
+        every search stays cheap; writes through this index reset it at once.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._version is None or now - self._version[1] >= max_age:
+                self._version = (self.conn.execute("SELECT version FROM write_version").fetchone()[0], now)
+            return self._version[0]
+
+    def content_stats(self):
+        """(chunks, distinct chunk contents) from the trigger-maintained counters"""
+        with self._lock:
+            return self.conn.execute("SELECT chunks, unique_contents FROM chunk_stats").fetchone()
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
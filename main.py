@@ -1,9 +1,10 @@
-from onboarding import RepoOnboarder
-from ragchatbot import RAGChatbot
+from repo_registry import RepoRegistry
 from dotenv import load_dotenv
 from configparser import ConfigParser
 import os
-import json
+
+# The chat stack (llama-index, Chroma, sentence-transformers) is imported
+# after the prompt, so the repo list shows up without waiting on it.
 
 load_dotenv()  # Load environment variables from .env
 api_key = os.getenv("GOOGLE_API_KEY")
@@ -12,27 +13,40 @@ os.environ["GOOGLE_API_KEY"] = api_key
 configur = ConfigParser()
 configur.read('config.ini')
 registry_file = configur['files'].get('registry_file')
-with open(registry_file, 'r') as f:
-    processed_repos = json.load(f)
+registry = RepoRegistry(configur['files'].get('registry_db', 'registry.sqlite'), legacy_json=registry_file)
 
-repos = list(processed_repos.keys())
+repos = registry.names()
 print("Available repos to chat: ", repos)
-repo_name = input('Please select existing repository or type github link to new repo: ')
-
-if repo_name not in repos:
-    #repo_url = input('Please enter github repo link: ')
-    onboarder = RepoOnboarder()
-    repo_info = onboarder.onboard(repo_name)
-    repo_name = repo_info['collection_name']
+repo_name = input("Please select existing repository, type 'all' to search every repository or type github link to new repo: ")
 
-chroma_path = 'chromadb/' + repo_name
-try:
-    chatbot = RAGChatbot(
-    chroma_path=chroma_path,
-    collection_name=repo_name,
+if repo_name == 'all':
+    from federated_search import FederatedSearch
+    from ragchatbot import RAGChatbot, FederatedRetriever
+    federated_search = FederatedSearch(
+        registry,
+        embedding_model=configur['config'].get('emebdding_model'),
+        backend=configur['config'].get('embedding_backend', 'torch'),
+        model_cache=configur['files'].get('model_cache', 'cache/models'),
+        max_workers=configur['config'].getint('federated_workers', 8)
     )
-except Exception as e:
-    print(e)
+    chatbot = RAGChatbot(retriever=FederatedRetriever(federated_search, similarity_top_k=5))
+else:
+    from ragchatbot import RAGChatbot
+    if repo_name not in repos:
+        #repo_url = input('Please enter github repo link: ')
+        from onboarding import RepoOnboarder
+        onboarder = RepoOnboarder()
+        repo_info = onboarder.onboard(repo_name)
+        repo_name = repo_info['collection_name']
+
+    chroma_path = 'chromadb/' + repo_name
+    try:
+        chatbot = RAGChatbot(
+        chroma_path=chroma_path,
+        collection_name=repo_name,
+        )
+    except Exception as e:
+        print(e)
 
 # Start interactive chat
 chatbot.start_chat()
\ No newline at end of file
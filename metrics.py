@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import threading
+import cProfile
+from contextlib import contextmanager
+from configparser import ConfigParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Process-wide timings and counters of the onboarding and chat pipelines.
+# Summaries and counters are keyed by (name, sorted label items); every
+# finished stage is also appended as a JSON line to the events file.
+_summaries = {}
+_counters = {}
+_lock = threading.Lock()
+_settings = None
+
+
+def _load_settings(config_file='config.ini'):
+    configur = ConfigParser()
+    configur.read(config_file)
+    config = configur['config'] if configur.has_section('config') else {}
+    files = configur['files'] if configur.has_section('files') else {}
+    return {
+        'events_file': files.get('metrics_events', 'cache/metrics.jsonl'),
+        'profile_dir': files.get('profile_dir', 'cache/profiles'),
+        'profile_stages': {s.strip() for s in config.get('profile_stages', '').split(',') if s.strip()},
+    }
+
+
+def get_settings():
+    """Events file, profile dir and profiled stages, read from config.ini on first use"""
+    global _settings
+    if _settings is None:
+        _settings = _load_settings()
+    return _settings
+
+
+def configure(events_file=None, profile_dir=None, profile_stages=None, config_file='config.ini'):
+    """Override the config.ini settings; an empty events_file disables JSON events"""
+    global _settings
+    settings = _load_settings(config_file)
+    if events_file is not None:
+        settings['events_file'] = events_file
+    if profile_dir is not None:
+        settings['profile_dir'] = profile_dir
+    if profile_stages is not None:
+        settings['profile_stages'] = set(profile_stages)
+    _settings = settings
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name, value, **labels):
+    """Add one observation (a duration, a batch size...) to the summary name"""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0})
+        summary['count'] += 1
+        summary['sum'] += value
+        summary['max'] = max(summary['max'], value)
+
+
+def increment(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def emit(event, **fields):
+    """Append a JSON event to the events file, if one is configured"""
+    events_file = get_settings()['events_file']
+    if not events_file:
+        return
+    record = {'ts': round(time.time(), 3), 'event': event, **fields}
+    line = json.dumps(record, default=str) + '\n'
+    with _lock:
+        dir_name = os.path.dirname(events_file)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        with open(events_file, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+def record_stage(stage, seconds, **fields):
+    """Record a finished stage: its duration summary plus a 'stage' event with fields"""
+    observe('stage_seconds', seconds, stage=stage)
+    emit('stage', stage=stage, seconds=round(seconds, 6), **fields)
+
+
+@contextmanager
+def stage(name, **fields):
+    """Time the enclosed block as stage name.
+
+    Yields a dict the block can add event fields to (counts, sizes...). Stages
+    listed in profile_stages run under cProfile and are dumped to profile_dir.
+    """
+    profiler = None
+    if name in get_settings()['profile_stages']:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active (a concurrent job), run this one unprofiled
+            profiler = None
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields['error'] = type(e).__name__
+        increment('stage_errors', stage=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            _dump_profile(name, profiler)
+        record_stage(name, seconds, **fields)
+
+
+def _dump_profile(name, profiler):
+    profile_dir = get_settings()['profile_dir']
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    print(f"Profile of stage '{name}' saved to {path}")
+
+
+def snapshot():
+    """Copy of all summaries and counters, as {name: [(labels, values)]}"""
+    with _lock:
+        summaries = {}
+        for (name, labels), summary in _summaries.items():
+            summaries.setdefault(name, []).append((dict(labels), dict(summary)))
+        counters = {}
+        for (name, labels), value in _counters.items():
+            counters.setdefault(name, []).append((dict(labels), value))
+    return {'summaries': summaries, 'counters': counters}
+
+
+def reset():
+    with _lock:
+        _summaries.clear()
+        _counters.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def render_prometheus(prefix='repochat'):
+    """All metrics in the Prometheus text exposition format"""
+    data = snapshot()
+    lines = []
+    for name, series in sorted(data['summaries'].items()):
+        metric = f'{prefix}_{name}'
+        lines.append(f'# TYPE {metric} summary')
+        for labels, summary in series:
+            lines.append(f"{metric}_count{_format_labels(labels)} {summary['count']}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {summary['sum']:.6f}")
+        lines.append(f'# TYPE {metric}_max gauge')
+        for labels, summary in series:
+            lines.append(f"{metric}_max{_format_labels(labels)} {summary['max']:.6f}")
+    for name, series in sorted(data['counters'].items()):
+        metric = f'{prefix}_{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        for labels, value in series:
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scraped every few seconds, keep the console quiet
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve /metrics on host:port from a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
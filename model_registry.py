@@ -0,0 +1,50 @@
+import threading
+import time
+from embedding_backend import load_embedding_model
+
+# One loaded embedding model per (model name, backend), shared by every
+# VectorStore and RAGChatbot in the process
+_models = {}
+_load_locks = {}
+_registry_lock = threading.Lock()
+
+
+def get_embedding_model(model_name, backend='torch', model_cache='cache/models'):
+    """Shared SentenceTransformer for model_name, loaded on first use"""
+    key = (model_name, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    # per-model lock: concurrent first callers wait for a single load
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    with load_lock:
+        if key not in _models:
+            start = time.perf_counter()
+            _models[key] = load_embedding_model(model_name, backend, model_cache)
+            print(f"Loaded embedding model {model_name} ({backend}) in {time.perf_counter() - start:.1f}s")
+    return _models[key]
+
+
+def register_embedding_model(model_name, model, backend='torch'):
+    """Use an already built model (e.g. a stub in benchmarks) for model_name"""
+    _models[(model_name, backend)] = model
+
+
+def warm_up(model_name, backend='torch', model_cache='cache/models'):
+    """Load the model and run one encode so the first real request is not slowed down"""
+    get_embedding_model(model_name, backend, model_cache).encode(['warm up'])
+
+
+def loaded_models():
+    """(model name, backend) pairs currently held in memory"""
+    return list(_models.keys())
+
+
+def release(model_name=None, backend='torch'):
+    """Drop one model, or every model if model_name is None"""
+    if model_name is None:
+        _models.clear()
+    else:
+        _models.pop((model_name, backend), None)
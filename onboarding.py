@@ -1,9 +1,10 @@
 from ingestion import ingestion 
 from processing import UniversalChunker, VectorStore
+from embedding_cache import EmbeddingCache
+from embedding_backend import embedding_model_key
+from repo_registry import RepoRegistry
 from configparser import ConfigParser
-import json
-import os
-from datetime import datetime
+import metrics
 
 class RepoOnboarder():
 
@@ -11,71 +12,204 @@ class RepoOnboarder():
         configur = ConfigParser()
         configur.read('config.ini')
         self.embedding_model = configur['config'].get('emebdding_model')
+        self.embedding_backend = configur['config'].get('embedding_backend', 'torch')
+        self.model_cache = configur['files'].get('model_cache', 'cache/models')
+        self.metadata_workers = configur['config'].getint('metadata_workers', None)
+        self.shallow_clone = configur['config'].getboolean('shallow_clone', False)
+        self.clone_branch = configur['config'].get('clone_branch') or None
+        self.chunk_workers = configur['config'].getint('chunk_workers', None)
+        self.chunk_batch_size = configur['config'].getint('chunk_batch_size', 256)
+        self.embed_batch_size = configur['config'].getint('embed_batch_size', 64)
+        self.write_queue_depth = configur['config'].getint('write_queue_depth', 2)
+        # a repo left 'Processing' longer than this by a crashed run may be onboarded again
+        self.stale_processing_seconds = configur['config'].getfloat('stale_processing_hours', 6) * 3600
+        # files over these caps are never chunked, 0 disables a cap
+        self.max_file_kb = configur['config'].getint('max_file_kb', 1024)
+        self.max_file_lines = configur['config'].getint('max_file_lines', 20000)
+        self.max_line_length = configur['config'].getint('max_line_length', 500)
+        # processed_repos.json (registry_file) is migrated into registry_db on first use
         self.registry_file = configur['files'].get('registry_file')
-        self.registry = self._load_registry()
+        self.registry = RepoRegistry(
+            configur['files'].get('registry_db', 'registry.sqlite'),
+            legacy_json=self.registry_file
+        )
+        # optional progress(stage, done, total) callback, set per onboard call
+        self.progress = None
+        # commit of the last ingested checkout, stored with the repo's stats
+        self.last_commit = None
+        # whether the last onboard call (re-)indexed the repo, False if it was already processed
+        self.indexed = False
+
+        # shared across repos, disabled when no cache file is configured
+        cache_file = configur['files'].get('embedding_cache', '')
+        self.embedding_cache = EmbeddingCache(
+            cache_file,
+            max_entries=configur['config'].getint('embedding_cache_max_entries', 2000000)
+        ) if cache_file else None
         
-    def _load_registry(self):
-        """Load existing registry or create new one"""
-        if os.path.exists(self.registry_file):
-            #print('True')
-            with open(self.registry_file, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def _save_registry(self):
-        """Save registry to file"""
-        with open(self.registry_file, 'w') as f:
-            json.dump(self.registry, f, indent=2)
-    
-    def _add_to_registry(self, repo_url, repo_name, repo_path, collection_path):
-        """Add new repo entry to registry"""
-        self.registry[repo_name] = {
-            "url": repo_url,
-            "collection_name": repo_name,
-            "local_path": repo_path,
-            "collection_path": collection_path,
-            "processed_date": datetime.now().strftime("%Y-%m-%d"),
-            "status": "Embedded"
-        }
-        self._save_registry()
+    def _claim_repo(self, repo_url, repo_name, repo_path):
+        """Register the repo as 'Processing' before touching its checkout, or raise if it is taken"""
+        claimed = self.registry.claim(
+            name=repo_name,
+            url=repo_url,
+            collection_name=repo_name,
+            local_path=repo_path,
+            collection_path='chromadb/' + repo_name,
+            stale_after=self.stale_processing_seconds
+        )
+        if not claimed:
+            info = self.registry.get(repo_name)
+            if info['status'] == 'Processing':
+                raise RuntimeError(f"Repo '{repo_name}' is already being processed")
+            raise RuntimeError(f"Repo '{repo_name}' is already registered for {info['url']}")
+
+    def _make_chunker(self):
+        return UniversalChunker(
+            embedding_model=self.embedding_model,
+            max_file_kb=self.max_file_kb,
+            max_file_lines=self.max_file_lines,
+            max_line_length=self.max_line_length
+        )
+
+    def _record_stats(self, stats):
+        """Store chunk count, embedding model and indexed commit of the current repo"""
+        self.registry.update_stats(
+            self.repo_name,
+            chunk_count=stats['total_chunks'],
+            embedding_model=embedding_model_key(self.embedding_model, self.embedding_backend),
+            last_commit=self.last_commit
+        )
     
     def is_repo_processed(self, repo_url):
-        """Check if repo is already processed"""
-        for repo_name, info in self.registry.items():
-            #print(repo_name)
-            if info['url'] == repo_url:
-                return True, repo_name, info
+        """Check if repo is already processed (an interrupted or failed onboarding is not)"""
+        info = self.registry.find_by_url(repo_url)
+        if info is not None and info['status'] == 'Embedded':
+            return True, info['name'], info
         return False, None, None
     
-    def ingest_repo(self, repo_url):
-        ingestor = ingestion(repo_url)
+    def _make_ingestor(self, repo_url):
+        return ingestion(
+            repo_url,
+            max_workers=self.metadata_workers,
+            shallow=self.shallow_clone,
+            branch=self.clone_branch,
+            progress=self.progress
+        )
+
+    def ingest_repo(self, repo_url, ingestor=None):
+        ingestor = ingestor or self._make_ingestor(repo_url)
         self.repo_name = ingestor.repo_name
         self.repo_path = ingestor.dest_path
         ingestor.ingest()
+        self.last_commit = ingestor.head_commit()
         
         return self.repo_name, self.repo_path
 
     def process_repo(self):
-        chunker = UniversalChunker()
-        print("Chunking all files in a directory recursively")
-        chunks = chunker.chunk_directory(self.repo_path)
-        print("Chunking completed")
-
         collection_path = 'chromadb/' + self.repo_name
         store = VectorStore(
             collection_name=self.repo_name, 
             persist_directory=collection_path, 
-            embedding_model=self.embedding_model
+            embedding_model=self.embedding_model,
+            batch_size=self.embed_batch_size,
+            queue_depth=self.write_queue_depth,
+            cache=self.embedding_cache,
+            backend=self.embedding_backend,
+            model_cache=self.model_cache
         )
-        store.add_chunks(chunks)
+
+        if store.collection.count():
+            # left by a failed run (e.g. a refresh that already wrote the new metadata.json):
+            # start over, upserting would keep the chunks of old file versions searchable
+            print("Clearing the chunks of a previous incomplete run")
+            store.clear()
+
+        chunker = self._make_chunker()
+        print("Chunking all files in a directory recursively")
+        # embed each batch as soon as it is chunked instead of holding every chunk;
+        # index is the wall time of the overlapping chunk, embed and write stages
+        with metrics.stage('index', repo=self.repo_name):
+            store.add_chunk_batches(chunker.chunk_directory_stream(
+                self.repo_path,
+                batch_size=self.chunk_batch_size,
+                max_workers=self.chunk_workers,
+                progress=self.progress
+            ), progress=self.progress)
+        print("Chunking and embedding completed")
+
         stats = store.get_collection_stats()
         print(f"\nCollection stats: {stats}")
+        self._record_stats(stats)
 
         return collection_path
     
-    def onboard(self, repo_url):
+    def refresh_repo(self, repo_url):
+        """Re-index only the files that were added, changed or removed since last ingestion"""
+        ingestor = self._make_ingestor(repo_url)
+        self.repo_name = ingestor.repo_name
+        self.repo_path = ingestor.dest_path
+        ingestor.ingest()
+        self.last_commit = ingestor.head_commit()
+
+        added, changed, removed = ingestion.diff_metadata(ingestor.previous_metadata, ingestor.metadata_list)
+        print(f"Files added: {len(added)}, changed: {len(changed)}, removed: {len(removed)}")
+
+        collection_path = 'chromadb/' + self.repo_name
+        store = VectorStore(
+            collection_name=self.repo_name,
+            persist_directory=collection_path,
+            embedding_model=self.embedding_model,
+            batch_size=self.embed_batch_size,
+            queue_depth=self.write_queue_depth,
+            cache=self.embedding_cache,
+            backend=self.embedding_backend,
+            model_cache=self.model_cache
+        )
+        # chunks of changed files are dropped and rebuilt from the new content
+        store.delete_files([m['path'] for m in changed + removed])
+
+        chunker = self._make_chunker()
+        print("Chunking added and changed files")
+        with metrics.stage('index', repo=self.repo_name, refresh=True):
+            store.add_chunk_batches(chunker.iter_chunk_batches(
+                added + changed,
+                batch_size=self.chunk_batch_size,
+                max_workers=self.chunk_workers,
+                progress=self.progress
+            ), progress=self.progress)
+        # skips of unchanged files stay in the report, those of re-checked or removed ones are replaced
+        chunker.save_skip_report(self.repo_path, replaced_paths=[m['path'] for m in added + changed + removed])
+        print("Chunking and embedding completed")
+        stats = store.get_collection_stats()
+        print(f"\nCollection stats: {stats}")
+        self._record_stats(stats)
+        return self.registry.get(self.repo_name)
+
+    def onboard(self, repo_url, refresh=False, progress=None):
+        """Ingest, chunk and embed repo_url unless already processed.
+
+        progress, if given, is called as progress(stage, done, total) for the
+        clone, metadata, chunk and embed stages (total is None when unknown).
+        """
+        self.progress = progress
+        self.indexed = False
         # Check if repo already processed
         is_processed, repo_name, repo_info = self.is_repo_processed(repo_url)
+
+        if is_processed and refresh:
+            # claim the repo so two processes never rewrite the same collection at once
+            if not self.registry.set_status(repo_name, "Processing", expected="Embedded"):
+                raise RuntimeError(f"Repo '{repo_name}' is already being processed")
+            print(f"\nRefreshing repo '{repo_name}'...\n")
+            try:
+                self.refresh_repo(repo_url)
+            except BaseException:
+                self.registry.set_status(repo_name, "Failed", expected="Processing")
+                raise
+            self.registry.set_status(repo_name, "Embedded", expected="Processing")
+            self.indexed = True
+            print(f"\n✓ Repo '{repo_name}' refreshed!\n")
+            return self.registry.get(repo_name)
         
         if is_processed:
             print(f"\n✓ Repo '{repo_name}' already processed!")
@@ -87,17 +221,55 @@ class RepoOnboarder():
         
         # Process new repo
         #print(f"\nProcessing new repo: {repo_url}\n")
-        self.repo_name, self.repo_path = self.ingest_repo(repo_url)
-        collection_path = self.process_repo()
+        # claimed before cloning, so two processes never clone into or embed the same repo at once
+        ingestor = self._make_ingestor(repo_url)
+        self._claim_repo(repo_url, ingestor.repo_name, ingestor.dest_path)
+        try:
+            self.ingest_repo(repo_url, ingestor)
+            self.process_repo()
+        except BaseException:
+            self.registry.set_status(ingestor.repo_name, "Failed", expected="Processing")
+            raise
         
-        # Add to registry
-        self._add_to_registry(repo_url, self.repo_name, self.repo_path, collection_path)
+        # Mark as ready in registry
+        self.registry.set_status(self.repo_name, "Embedded", expected="Processing")
+        self.indexed = True
         print(f"\n✓ Repo '{self.repo_name}' added to registry!\n")
         
-        return self.registry[self.repo_name]
+        return self.registry.get(self.repo_name)
+
+    def close(self):
+        """Close the registry and embedding cache connections"""
+        self.registry.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
 
 
 if __name__ == "__main__":
-    repo_url = input('Please enter github repo link: ')
+    # e.g. nightly from cron: python onboarding.py --refresh
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description="Onboard a repo, or refresh processed repos in place")
+    parser.add_argument('repo_urls', nargs='*', help="repos to onboard or refresh (asked for if omitted)")
+    parser.add_argument('--refresh', action='store_true',
+                        help="re-index only changed files; refreshes every processed repo when no URL is given")
+    args = parser.parse_args()
+
     onboarder = RepoOnboarder()
-    repo_info = onboarder.onboard(repo_url)
\ No newline at end of file
+    repo_urls = args.repo_urls
+    if not repo_urls:
+        if args.refresh:
+            repo_urls = [info['url'] for info in onboarder.registry.list_repos('Embedded')]
+        else:
+            repo_urls = [input('Please enter github repo link: ')]
+    failed = []
+    try:
+        for repo_url in repo_urls:
+            try:
+                onboarder.onboard(repo_url, refresh=args.refresh)
+            except Exception as e:
+                print(f"❌ {repo_url}: {e}")
+                failed.append(repo_url)
+    finally:
+        onboarder.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,230 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback to stop a cancelled onboarding job"""
+
+
+def normalize_repo_url(repo_url):
+    """Form used to coalesce submissions of the same repo"""
+    repo_url = repo_url.strip().rstrip('/')
+    if repo_url.endswith('.git'):
+        repo_url = repo_url[:-4]
+    return repo_url
+
+
+class OnboardingJobs:
+    """Runs repo onboarding in background threads and tracks it in a SQLite job table.
+
+    At most max_workers jobs run at once, the rest wait as 'queued'. A URL
+    that already has a queued or running job is coalesced onto that job.
+    Progress per stage is kept in memory and flushed to the table at most
+    every flush_interval seconds, so pollers can read it from any process.
+    Jobs still queued or running when the process stopped are resumed.
+    on_done, if given, is called with the registry entry of each repo a job
+    actually (re-)indexed, not of repos that were already processed.
+    """
+
+    def __init__(self, db_path='cache/jobs.sqlite', max_workers=2, onboarder_factory=None, flush_interval=1.0,
+                 on_done=None):
+        if onboarder_factory is None:
+            from onboarding import RepoOnboarder
+            onboarder_factory = RepoOnboarder
+        self.onboarder_factory = onboarder_factory
+        self.flush_interval = flush_interval
+        self.on_done = on_done
+        self._lock = threading.Lock()
+        self._cancel_events = {}
+        self._live = {}  # job id -> in-memory progress of running jobs
+
+        dir_name = os.path.dirname(db_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                repo_url TEXT NOT NULL,
+                refresh INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress TEXT NOT NULL DEFAULT '{}',
+                repo_name TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_url_status ON jobs(repo_url, status)")
+        self.conn.commit()
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='onboarding')
+        self._resume()
+
+    def _resume(self):
+        """Requeue jobs interrupted by a restart"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, repo_url, refresh FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES
+            ).fetchall()
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL, progress = '{}' WHERE status IN (?, ?)",
+                ACTIVE_STATUSES
+            )
+            self.conn.commit()
+        for job_id, repo_url, refresh in rows:
+            self._start(job_id, repo_url, bool(refresh))
+
+    def _start(self, job_id, repo_url, refresh):
+        self._cancel_events[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id, repo_url, refresh)
+
+    def submit(self, repo_url, refresh=False):
+        """Queue onboarding of repo_url and return the job id (an existing one if already active)"""
+        repo_url = normalize_repo_url(repo_url)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE repo_url = ? AND status IN (?, ?)",
+                (repo_url, *ACTIVE_STATUSES)
+            ).fetchone()
+            if row:
+                return row[0]
+            job_id = uuid.uuid4().hex[:12]
+            self.conn.execute(
+                "INSERT INTO jobs (id, repo_url, refresh, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, repo_url, int(refresh), time.time())
+            )
+            self.conn.commit()
+        self._start(job_id, repo_url, refresh)
+        return job_id
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop; returns False if it is not active"""
+        event = self._cancel_events.get(job_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def _update(self, job_id, **fields):
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self.conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self.conn.commit()
+
+    def _flush(self, job_id):
+        live = self._live.get(job_id)
+        if live is not None:
+            live['flushed_at'] = time.time()
+            self._update(job_id, stage=live['stage'], progress=json.dumps(live['stages']))
+
+    def _progress_callback(self, job_id):
+        """progress(stage, done, total) hook passed to RepoOnboarder.onboard"""
+        cancel_event = self._cancel_events[job_id]
+        live = self._live[job_id]
+
+        def report(stage, done, total=None):
+            if cancel_event.is_set():
+                raise JobCancelled(job_id)
+            now = time.time()
+            new_stage = stage not in live['stages']
+            if new_stage:
+                # copied rather than mutated, pollers may be serialising the old dict
+                live['stages'] = {**live['stages'], stage: {'done': 0, 'total': None, 'started_at': now, 'updated_at': now}}
+            state = live['stages'][stage]
+            state['done'] = done
+            state['total'] = total
+            state['updated_at'] = now
+            live['stage'] = stage
+            if new_stage or now - live['flushed_at'] >= self.flush_interval:
+                self._flush(job_id)
+
+        return report
+
+    def _run(self, job_id, repo_url, refresh):
+        if self._cancel_events[job_id].is_set():
+            self._update(job_id, status='cancelled', finished_at=time.time())
+            self._cancel_events.pop(job_id, None)
+            return
+
+        self._live[job_id] = {'stage': None, 'stages': {}, 'flushed_at': 0.0}
+        self._update(job_id, status='running', started_at=time.time())
+        onboarder = None
+        try:
+            onboarder = self.onboarder_factory()
+            repo_info = onboarder.onboard(
+                repo_url,
+                refresh=refresh,
+                progress=self._progress_callback(job_id)
+            )
+            self._flush(job_id)
+            self._update(job_id, status='done', repo_name=repo_info['collection_name'], finished_at=time.time())
+            if self.on_done is not None and onboarder.indexed:
+                self.on_done(repo_info)
+        except JobCancelled:
+            self._flush(job_id)
+            self._update(job_id, status='cancelled', finished_at=time.time())
+        except Exception as e:
+            self._flush(job_id)
+            self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+        finally:
+            if onboarder is not None:
+                onboarder.close()
+            self._live.pop(job_id, None)
+            self._cancel_events.pop(job_id, None)
+
+    @staticmethod
+    def _with_eta(job, now):
+        """Add an ETA in seconds to each stage with a known total, and the largest one to the job"""
+        job['eta'] = None
+        for state in job['progress'].values():
+            done, total = state['done'], state.get('total')
+            state['eta'] = None
+            if total and done:
+                elapsed = state.get('updated_at', now) - state['started_at']
+                state['eta'] = elapsed / done * (total - done)
+                if job['status'] == 'running':
+                    job['eta'] = max(job['eta'] or 0.0, state['eta'])
+        return job
+
+    def _row_to_job(self, row):
+        job = dict(zip(
+            ('id', 'repo_url', 'refresh', 'status', 'stage', 'progress', 'repo_name', 'error',
+             'created_at', 'started_at', 'finished_at'),
+            row
+        ))
+        job['refresh'] = bool(job['refresh'])
+        job['progress'] = json.loads(job['progress'])
+        live = self._live.get(job['id'])
+        if live is not None:
+            # fresher than the last flush
+            job['stage'] = live['stage']
+            job['progress'] = json.loads(json.dumps(live['stages']))
+        return self._with_eta(job, time.time())
+
+    def get_job(self, job_id):
+        """Status, current stage and per-stage progress / ETA of a job, None if unknown"""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, limit=20):
+        """Most recent jobs first"""
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        self.conn.close()
@@ -2,20 +2,192 @@ import os
 import ast
 import json
 import re
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from typing import List, Dict
-import chromadb
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Iterator
+from embedding_backend import embedding_model_key
+from model_registry import get_embedding_model
+from hnsw_config import hnsw_settings, open_collection
 import hashlib
+import copy
+from embedding_cache import content_hash
+from lexical_index import LexicalIndex, identifiers_in, reciprocal_rank_fusion
+from query_cache import LRUCache, query_embedding_cache, retrieval_cache, get_collection_version, bump_collection_version
+import queue
+import threading
+import time
+import metrics
+from tqdm import tqdm
 from configparser import ConfigParser
 
+# Tokenizer of the embedding model, loaded per process by set_tokenizer.
+# Until one is set, chunk sizes fall back to the len // 4 estimate.
+_tokenizer = None
+_tokenizer_name = None
+
+def set_tokenizer(model_name):
+    """Size chunks with the tokenizer of model_name (no-op if already loaded)"""
+    global _tokenizer, _tokenizer_name
+    if model_name == _tokenizer_name:
+        return
+    from transformers import AutoTokenizer
+    _tokenizer = AutoTokenizer.from_pretrained(model_name)
+    _tokenizer_name = model_name
+    _count_short_tokens.cache_clear()
+    _long_token_counts.clear()
+
+def _sentence_bert_max_length(model_name, model_cache='cache/models'):
+    """max_seq_length from sentence_bert_config.json, or None if it can't be read"""
+    # a local model directory, then the ONNX export, then the hub (or its cache)
+    for model_dir in (model_name, os.path.join(model_cache, model_name.replace('/', '--'))):
+        config_path = os.path.join(model_dir, 'sentence_bert_config.json')
+        if os.path.isfile(config_path):
+            break
+    try:
+        if not os.path.isfile(config_path):
+            from huggingface_hub import hf_hub_download
+            config_path = hf_hub_download(model_name, 'sentence_bert_config.json')
+        with open(config_path) as f:
+            return json.load(f)['max_seq_length']
+    except Exception:
+        return None
+
+def get_model_max_tokens(model_name, model_cache='cache/models'):
+    """Max sequence length the embedding model encodes, excluding special tokens"""
+    set_tokenizer(model_name)
+    # sentence-transformers models truncate below the tokenizer limit
+    max_length = _sentence_bert_max_length(model_name, model_cache)
+    if max_length is None:
+        # no config to read: ask the model itself, the tokenizer limit is too high
+        max_length = get_embedding_model(model_name, model_cache=model_cache).max_seq_length
+    return max_length - _tokenizer.num_special_tokens_to_add()
+
+# Short strings (lines, separators, small pieces) repeat a lot and are cached
+# as is; longer texts are cached by digest, so the cache never keeps whole
+# files or sections alive in the chunking workers.
+SHORT_TEXT_CHARS = 256
+_long_token_counts = LRUCache(maxsize=4096)
+
+def _encode_length(text):
+    return len(_tokenizer.encode(text, add_special_tokens=False, verbose=False))
+
+@lru_cache(maxsize=65536)
+def _count_short_tokens(text):
+    return _encode_length(text)
+
+def _count_tokens(text):
+    if len(text) <= SHORT_TEXT_CHARS:
+        return _count_short_tokens(text)
+    key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    count = _long_token_counts.get(key)
+    if count is None:
+        count = _encode_length(text)
+        _long_token_counts.put(key, count)
+    return count
+
 # Python AST Chunker (from previous code)
 def get_chunk_size(code):
-    return len(code) // 4
+    if _tokenizer is None:
+        return len(code) // 4
+    return _count_tokens(code)
+
+# Running sizes: chunkers add up piece_size of the pieces they join and
+# convert the total with to_chunk_size, instead of re-measuring the growing
+# string. Exact for the len // 4 estimate, a close upper bound with a tokenizer.
+def piece_size(text):
+    if _tokenizer is None:
+        return len(text)
+    return _count_tokens(text)
+
+def to_chunk_size(total):
+    if _tokenizer is None:
+        return total // 4
+    return total
+
+class RunningChunk:
+    """Pieces joined by sep with a running size, so appending is O(len(piece))"""
+
+    def __init__(self, sep):
+        self.sep = sep
+        self.sep_size = piece_size(sep)
+        self.parts = []
+        self.size = 0
+
+    def reset(self, text=None, size=0):
+        self.parts = [text] if text else []
+        self.size = size if text else 0
+
+    def append(self, text, size):
+        """Append like `chunk += sep + text if chunk else text`"""
+        if self.parts:
+            self.parts.append(text)
+            self.size += self.sep_size + size
+        else:
+            self.reset(text, size)
+
+    def __bool__(self):
+        return bool(self.parts)
+
+    def text(self):
+        return self.sep.join(self.parts)
+
+def split_lines_to_fit(lines, line_numbers, max_tokens):
+    """Split lines into consecutive pieces of at most max_tokens each.
+
+    line_numbers holds the 1-based source line of every entry in lines.
+    Returns (content, start_line, end_line) tuples. A single line longer
+    than max_tokens is kept whole since it cannot be split on a line boundary.
+    """
+    pieces = []
+    current = []
+    current_size = 0
+    piece_start = 0
+
+    for i, line in enumerate(lines):
+        line_size = get_chunk_size(line) + 1  # +1 for the joining newline
+        if current and current_size + line_size > max_tokens:
+            pieces.append(("\n".join(current), line_numbers[piece_start], line_numbers[i - 1]))
+            current = []
+            current_size = 0
+            piece_start = i
+        current.append(line)
+        current_size += line_size
+
+    if current:
+        pieces.append(("\n".join(current), line_numbers[piece_start], line_numbers[len(lines) - 1]))
+    return pieces
+
+def split_oversized_chunks(chunks, max_tokens):
+    """Split any chunk larger than max_tokens into line-contiguous pieces"""
+    result = []
+    for chunk in chunks:
+        if get_chunk_size(chunk['content']) <= max_tokens:
+            result.append(chunk)
+            continue
+        lines = chunk['content'].split("\n")
+        start = chunk.get('start_line', 1)
+        line_numbers = range(start, start + len(lines))
+        for content, start_line, end_line in split_lines_to_fit(lines, line_numbers, max_tokens):
+            piece = dict(chunk)
+            piece.update({"content": content, "start_line": start_line, "end_line": end_line})
+            result.append(piece)
+    return result
 
 def extract_code_segment(lines, start, end):
     return "\n".join(lines[start:end])
 
+def split_member_lines(lines, start, end, name, max_tokens):
+    """class_part chunks of a member too large for one chunk, from its own lines [start, end)"""
+    return [{
+        "content": content,
+        "start_line": start_line,
+        "end_line": end_line,
+        "chunk_type": "class_part",
+        "name": name
+    } for content, start_line, end_line in split_lines_to_fit(lines[start:end], range(start + 1, end + 1), max_tokens)]
+
 def split_large_class(node, code_lines, max_tokens=500):
     chunks = []
     class_start = node.lineno - 1
@@ -27,8 +199,13 @@ def split_large_class(node, code_lines, max_tokens=500):
             break
     
     header = extract_code_segment(code_lines, class_start, header_end)
+    continued = "\n    # ... (continued)\n"
+    header_size = piece_size(header)
 
-    current_chunk = header
+    current_chunk = RunningChunk("\n")
+    current_chunk.parts = [header]
+    current_chunk.size = header_size
+    has_content = bool(header.strip())
     current_start = class_start + 1
     current_end = header_end
     
@@ -37,26 +214,35 @@ def split_large_class(node, code_lines, max_tokens=500):
             method_start = item.lineno - 1
             method_end = item.end_lineno
             method_code = extract_code_segment(code_lines, method_start, method_end)
+            method_size = piece_size(method_code)
             
-            test_chunk = current_chunk + "\n" + method_code
-            if get_chunk_size(test_chunk) > max_tokens and current_chunk.strip():
+            test_size = to_chunk_size(current_chunk.size + current_chunk.sep_size + method_size)
+            if test_size > max_tokens and has_content:
                 chunks.append({
-                    "content": current_chunk,
+                    "content": current_chunk.text(),
                     "start_line": current_start,
                     "end_line": current_end,
                     "chunk_type": "class_part",
                     "name": node.name
                 })
-                current_chunk = header + "\n    # ... (continued)\n" + method_code
+                current_chunk.parts = [header + continued.rstrip("\n")]
+                current_chunk.size = header_size + piece_size(continued)
+                has_content = False
+
+            if to_chunk_size(header_size + piece_size(continued) + method_size) > max_tokens:
+                # split the method on its own so every piece keeps its real line range
+                chunks.extend(split_member_lines(code_lines, method_start, method_end, node.name, max_tokens))
+                continue
+            if not has_content:
                 current_start = method_start + 1
-                current_end = method_end
-            else:
-                current_chunk = test_chunk
-                current_end = method_end
+            current_chunk.parts.append(method_code)
+            current_chunk.size += current_chunk.sep_size + method_size
+            current_end = method_end
+            has_content = True
     
-    if current_chunk.strip():
+    if has_content:
         chunks.append({
-            "content": current_chunk,
+            "content": current_chunk.text(),
             "start_line": current_start,
             "end_line": current_end,
             "chunk_type": "class_part" if len(chunks) > 0 else "class",
@@ -65,6 +251,45 @@ def split_large_class(node, code_lines, max_tokens=500):
     
     return chunks
 
+def top_level_chunks(lines, covered_ranges, max_tokens=500):
+    """Chunk the lines not covered by any (start, end) definition range"""
+    chunks = []
+    # gaps between definitions, as (start, end) slices of lines
+    gaps = []
+    prev_end = 0
+    for start_line, end_line in covered_ranges:
+        if start_line > prev_end:
+            gaps.append((prev_end, start_line))
+        prev_end = max(prev_end, end_line)
+    if prev_end < len(lines):
+        gaps.append((prev_end, len(lines)))
+
+    leftover_lines = []
+    for start, end in gaps:
+        leftover_lines.extend(lines[start:end])
+    if leftover_lines:
+        leftover_content = "\n".join(leftover_lines)
+        if get_chunk_size(leftover_content) > max_tokens:
+            # keep the real line range of each piece rather than the whole file
+            line_numbers = []
+            for start, end in gaps:
+                line_numbers.extend(range(start + 1, end + 1))
+            for content, start_line, end_line in split_lines_to_fit(leftover_lines, line_numbers, max_tokens):
+                chunks.append({
+                    "content": content,
+                    "start_line": start_line,
+                    "end_line": end_line,
+                    "chunk_type": "top_level"
+                })
+        else:
+            chunks.append({
+                "content": leftover_content,
+                "start_line": 1,
+                "end_line": len(lines),
+                "chunk_type": "top_level"
+            })
+    return chunks
+
 def chunk_python_code(code, max_tokens=500):
     chunks = []
     lines = code.split("\n")
@@ -74,7 +299,8 @@ def chunk_python_code(code, max_tokens=500):
     except SyntaxError:
         return [{"content": code, "start_line": 1, "end_line": len(lines), "chunk_type": "full_file"}]
     
-    covered_lines = set()
+    # line ranges of top-level definitions, in source order
+    covered_ranges = []
     
     for node in tree.body:
         if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
@@ -82,8 +308,7 @@ def chunk_python_code(code, max_tokens=500):
             end_line = node.end_lineno
             chunk_code = extract_code_segment(lines, start_line, end_line)
             
-            for i in range(start_line, end_line):
-                covered_lines.add(i)
+            covered_ranges.append((start_line, end_line))
             
             if get_chunk_size(chunk_code) > max_tokens:
                 if isinstance(node, ast.ClassDef):
@@ -107,15 +332,7 @@ def chunk_python_code(code, max_tokens=500):
                     "name": node.name
                 })
     
-    leftover_lines = [line for i, line in enumerate(lines) if i not in covered_lines]
-    if leftover_lines:
-        chunks.append({
-            "content": "\n".join(leftover_lines),
-            "start_line": 1,
-            "end_line": len(lines),
-            "chunk_type": "top_level"
-        })
-    
+    chunks.extend(top_level_chunks(lines, covered_ranges, max_tokens))
     return chunks
 
 
@@ -127,34 +344,35 @@ def chunk_markdown(content, max_tokens=500):
     current_line = 1  # Track line number
     
     for section in sections:
-        section_lines = section.split('\n')
         start_line = current_line
-        end_line = current_line + len(section_lines) - 1
+        end_line = current_line + section.count('\n')
         
         if get_chunk_size(section) > max_tokens:
             paragraphs = section.split('\n\n')
             para_line = start_line
-            current_chunk = ""
+            current_chunk = RunningChunk("\n\n")
             chunk_start = para_line
             
             for para in paragraphs:
-                para_lines = len(para.split('\n'))
-                if get_chunk_size(current_chunk + para) > max_tokens and current_chunk:
+                para_lines = para.count('\n') + 1
+                para_size = piece_size(para)
+                if to_chunk_size(current_chunk.size + para_size) > max_tokens and current_chunk:
                     chunks.append({
-                        "content": current_chunk.strip(),
+                        "content": current_chunk.text().strip(),
                         "chunk_type": "markdown_section",
                         "start_line": chunk_start,
                         "end_line": para_line - 1
                     })
-                    current_chunk = para
+                    current_chunk.reset(para, para_size)
                     chunk_start = para_line
                 else:
-                    current_chunk += "\n\n" + para if current_chunk else para
+                    current_chunk.append(para, para_size)
                 para_line += para_lines
             
-            if current_chunk.strip():
+            current_content = current_chunk.text()
+            if current_content.strip():
                 chunks.append({
-                    "content": current_chunk.strip(),
+                    "content": current_content.strip(),
                     "chunk_type": "markdown_section",
                     "start_line": chunk_start,
                     "end_line": end_line
@@ -183,7 +401,7 @@ def chunk_json(content, max_tokens=500):
             current_line = 1
             for key, value in data.items():
                 chunk_content = json.dumps({key: value}, indent=2)
-                chunk_lines = len(chunk_content.split('\n'))
+                chunk_lines = chunk_content.count('\n') + 1
                 chunks.append({
                     "content": chunk_content,
                     "chunk_type": "json_key",
@@ -197,7 +415,7 @@ def chunk_json(content, max_tokens=500):
             current_line = 1
             for i, item in enumerate(data):
                 chunk_content = json.dumps(item, indent=2)
-                chunk_lines = len(chunk_content.split('\n'))
+                chunk_lines = chunk_content.count('\n') + 1
                 chunks.append({
                     "content": chunk_content,
                     "chunk_type": "json_array_item",
@@ -223,34 +441,122 @@ def chunk_json(content, max_tokens=500):
             "end_line": len(content.split('\n'))
         }]
 
+# Jupyter Notebook Chunker
+NOTEBOOK_SOURCE_KEY = re.compile(r'^\s*"source":\s*(.*?)\s*$')
+# IPython magics and shell escapes (%matplotlib, %%time, !pip) are not Python
+IPYTHON_MAGIC = re.compile(r'^(\s*)([%!])', re.M)
+
+def notebook_cell_lines(content, cell_count):
+    """Line of each cell's first source line in the .ipynb file, None if the layout is unknown.
+
+    nbformat writes one source line per JSON line after the cell's `"source": [`;
+    a notebook stored another way (single-line JSON) cannot be mapped.
+    """
+    starts = []
+    for i, line in enumerate(content.split('\n')):
+        match = NOTEBOOK_SOURCE_KEY.match(line)
+        if match:
+            # a list opened on this line starts on the next one, [] or a string stays here
+            starts.append(i + 2 if match.group(1) == '[' else i + 1)
+    return starts if len(starts) == cell_count else None
+
+def summarize_outputs(outputs):
+    """'stream, image/png, error: ValueError' for a code cell's outputs, which are not embedded"""
+    kinds = []
+    for output in outputs:
+        if output.get('output_type') == 'error':
+            kind = f"error: {output.get('ename', '')}"
+        elif output.get('output_type') == 'stream':
+            kind = 'stream'
+        else:
+            # display_data / execute_result, named by their richest mime type
+            mime_types = list(output.get('data', {}))
+            kind = next((m for m in mime_types if not m.startswith('text/')), mime_types[0] if mime_types else output.get('output_type', ''))
+        if kind not in kinds:
+            kinds.append(kind)
+    return ', '.join(kinds)
+
+def chunk_notebook(content, max_tokens=500):
+    """Chunk the code and markdown cells of a notebook, leaving out outputs and execution counts.
+
+    Code cells of Python kernels go through chunk_python_code, other kernels'
+    through chunk_text, and markdown cells through chunk_markdown. Each chunk
+    records its cell_index and cell_type (and a summary of the cell's outputs),
+    with start_line / end_line mapped back to lines of the .ipynb file.
+    """
+    try:
+        notebook = json.loads(content)
+        cells = notebook['cells']
+    except (json.JSONDecodeError, KeyError, TypeError):
+        # not nbformat 4, chunk it as plain text
+        return chunk_text(content, max_tokens)
+
+    metadata = notebook.get('metadata', {})
+    language = (metadata.get('kernelspec', {}).get('language') or metadata.get('language_info', {}).get('name') or 'python').lower()
+    cell_lines = notebook_cell_lines(content, len(cells))
+
+    chunks = []
+    for cell_index, cell in enumerate(cells):
+        source = cell.get('source', '')
+        source = ''.join(source) if isinstance(source, list) else source
+        if not source.strip() or cell.get('cell_type') not in ('code', 'markdown'):
+            continue
+        if cell['cell_type'] == 'markdown':
+            cell_chunks = chunk_markdown(source, max_tokens)
+        elif language == 'python':
+            # commented out so the cell still parses; lines are kept one for one
+            cell_chunks = chunk_python_code(IPYTHON_MAGIC.sub(r'\1#\2', source), max_tokens)
+        else:
+            cell_chunks = chunk_text(source, max_tokens)
+        outputs = summarize_outputs(cell.get('outputs', []))
+
+        for chunk in split_oversized_chunks(cell_chunks, max_tokens):
+            if not chunk['content'].strip():
+                continue
+            if cell_lines:
+                offset = cell_lines[cell_index] - 1
+                chunk['start_line'] = chunk.get('start_line', 1) + offset
+                chunk['end_line'] = chunk.get('end_line', chunk['start_line']) + offset
+            else:
+                # lines of an unmapped notebook would point anywhere, use its first line
+                chunk['start_line'] = chunk['end_line'] = 1
+            chunk['cell_index'] = cell_index
+            chunk['cell_type'] = cell['cell_type']
+            if outputs:
+                chunk['cell_outputs'] = outputs
+            chunks.append(chunk)
+    return chunks
+
 # Generic Text Chunker
 def chunk_text(content, max_tokens=500):
     chunks = []
     paragraphs = content.split('\n\n')
-    current_chunk = ""
+    current_chunk = RunningChunk("\n\n")
     current_line = 1
     chunk_start_line = 1
     
     for para in paragraphs:
-        para_lines = len(para.split('\n'))
+        para_lines = para.count('\n') + 1
+        para_size = piece_size(para)
         
-        if get_chunk_size(current_chunk + para) > max_tokens and current_chunk:
+        if to_chunk_size(current_chunk.size + para_size) > max_tokens and current_chunk:
             chunks.append({
-                "content": current_chunk.strip(),
+                "content": current_chunk.text().strip(),
                 "chunk_type": "text_chunk",
                 "start_line": chunk_start_line,
                 "end_line": current_line - 1
             })
-            current_chunk = para
+            current_chunk.reset(para, para_size)
             chunk_start_line = current_line
         else:
-            current_chunk += "\n\n" + para if current_chunk else para
+            current_chunk.append(para, para_size)
         
         current_line += para_lines + 2  # +2 for \n\n separator
     
-    if current_chunk.strip():
+    current_content = current_chunk.text()
+    if current_content.strip():
         chunks.append({
-            "content": current_chunk.strip(),
+            "content": current_content.strip(),
             "chunk_type": "text_chunk",
             "start_line": chunk_start_line,
             "end_line": current_line - 1
@@ -277,14 +583,278 @@ def chunk_by_lines(content, max_tokens=500):
     return chunks
 
 
+# Syntax-aware Chunker (tree-sitter) for non-Python code
+# extension -> (grammar module, function returning the language)
+SYNTAX_GRAMMARS = {
+    '.js': ('tree_sitter_javascript', 'language'),
+    '.jsx': ('tree_sitter_javascript', 'language'),
+    '.ts': ('tree_sitter_typescript', 'language_typescript'),
+    '.tsx': ('tree_sitter_typescript', 'language_tsx'),
+    '.java': ('tree_sitter_java', 'language'),
+    '.go': ('tree_sitter_go', 'language'),
+    '.rs': ('tree_sitter_rust', 'language'),
+    '.c': ('tree_sitter_c', 'language'),
+    # headers may be C or C++, the C++ grammar parses both
+    '.h': ('tree_sitter_cpp', 'language'),
+    '.cpp': ('tree_sitter_cpp', 'language'),
+    '.hpp': ('tree_sitter_cpp', 'language'),
+    '.rb': ('tree_sitter_ruby', 'language'),
+    '.php': ('tree_sitter_php', 'language_php'),
+}
+SYNTAX_FUNCTION_TYPES = {
+    'function_declaration', 'generator_function_declaration', 'function_definition',
+    'function_item', 'method_declaration', 'method_definition', 'constructor_declaration',
+    'method', 'singleton_method'
+}
+SYNTAX_CLASS_TYPES = {
+    'class_declaration', 'abstract_class_declaration', 'interface_declaration', 'enum_declaration',
+    'record_declaration', 'annotation_type_declaration', 'trait_declaration', 'struct_item',
+    'enum_item', 'union_item', 'trait_item', 'impl_item', 'mod_item', 'class_specifier',
+    'struct_specifier', 'union_specifier', 'enum_specifier', 'namespace_definition', 'class',
+    'module', 'type_declaration', 'type_definition'
+}
+# only definitions when they have a body, e.g. not `struct S;` or PHP `namespace A;`
+SYNTAX_BODY_REQUIRED = {'struct_specifier', 'union_specifier', 'enum_specifier', 'class_specifier', 'namespace_definition'}
+# `export ...` / `template <...>` wrap the actual definition
+SYNTAX_WRAPPER_TYPES = {'export_statement', 'template_declaration'}
+# `const f = () => {}` style functions
+SYNTAX_FUNCTION_VALUES = {'arrow_function', 'function_expression', 'function', 'generator_function'}
+
+_syntax_parsers = {}
+# parse trees keyed by (grammar, sha256 of content), per process
+syntax_tree_cache = LRUCache(maxsize=128)
+
+def _get_syntax_parser(file_ext):
+    """tree-sitter parser for an extension, None if the grammar is not installed"""
+    grammar = SYNTAX_GRAMMARS.get(file_ext)
+    if grammar is None:
+        return None
+    if grammar not in _syntax_parsers:
+        try:
+            import importlib
+            from tree_sitter import Language, Parser
+            module = importlib.import_module(grammar[0])
+            _syntax_parsers[grammar] = Parser(Language(getattr(module, grammar[1])()))
+        except ImportError:
+            _syntax_parsers[grammar] = None
+    return _syntax_parsers[grammar]
+
+def _syntax_end_row(node):
+    """Last row of a node, ignoring a trailing newline that ends it at column 0"""
+    end = node.end_point
+    if end.column == 0 and end.row > node.start_point.row:
+        return end.row - 1
+    return end.row
+
+def _syntax_definition(node):
+    """(definition node, 'function' | 'class') for a top-level node, or None"""
+    if node.type in SYNTAX_WRAPPER_TYPES:
+        for child in node.named_children:
+            found = _syntax_definition(child)
+            if found:
+                return found
+        return None
+    if node.type in SYNTAX_FUNCTION_TYPES:
+        return node, 'function'
+    if node.type in SYNTAX_CLASS_TYPES:
+        if node.type in SYNTAX_BODY_REQUIRED and node.child_by_field_name('body') is None:
+            return None
+        return node, 'class'
+    if node.type in ('lexical_declaration', 'variable_declaration'):
+        for declarator in node.named_children:
+            value = declarator.child_by_field_name('value')
+            if declarator.type == 'variable_declarator' and value is not None and value.type in SYNTAX_FUNCTION_VALUES:
+                return declarator, 'function'
+    return None
+
+def _syntax_node_name(node):
+    name = node.child_by_field_name('name')
+    if name is None and node.type == 'impl_item':
+        name = node.child_by_field_name('type')
+    if name is None:
+        # C/C++ functions and typedefs: follow the declarator chain
+        declarator = node.child_by_field_name('declarator')
+        while declarator is not None and declarator.child_by_field_name('declarator') is not None:
+            declarator = declarator.child_by_field_name('declarator')
+        name = declarator
+    if name is None:
+        # Go `type T struct`, name sits on the type_spec child
+        for child in node.named_children:
+            name = child.child_by_field_name('name')
+            if name is not None:
+                break
+    if name is None:
+        return None
+    # qualified names such as C::m
+    while name.child_by_field_name('name') is not None:
+        name = name.child_by_field_name('name')
+    return name.text.decode('utf-8', errors='replace')
+
+def _syntax_body(node):
+    body = node.child_by_field_name('body')
+    if body is None:
+        # C `typedef struct {...} T;` keeps the body on the struct child
+        for child in node.named_children:
+            body = child.child_by_field_name('body')
+            if body is not None:
+                break
+    return body
+
+def split_large_definition(node, def_node, name, lines, max_tokens=500, comment_prefix="//"):
+    """Split an oversized class-like definition between its members, like split_large_class"""
+    start = node.start_point.row
+    end = _syntax_end_row(node) + 1
+    body = _syntax_body(def_node)
+    members = [member for member in body.named_children if member.type != 'comment'] if body is not None else []
+    if not members:
+        return [{
+            "content": extract_code_segment(lines, start, end),
+            "start_line": start + 1,
+            "end_line": end,
+            "chunk_type": "class",
+            "name": name
+        }]
+
+    chunks = []
+    header_end = max(start + 1, members[0].start_point.row)
+    header = extract_code_segment(lines, start, header_end)
+    continued = f"\n    {comment_prefix} ... (continued)\n"
+    header_size = piece_size(header)
+
+    current_chunk = RunningChunk("\n")
+    current_chunk.parts = [header]
+    current_chunk.size = header_size
+    has_content = True
+    current_start = start + 1
+    current_end = header_end
+    prev_end = header_end
+
+    for i, member in enumerate(members):
+        # members take the comments and blank lines above them, the last one the closing lines
+        member_end = end if i == len(members) - 1 else _syntax_end_row(member) + 1
+        if member_end <= prev_end:
+            continue
+        member_start = prev_end
+        prev_end = member_end
+        member_code = extract_code_segment(lines, member_start, member_end)
+        member_size = piece_size(member_code)
+
+        test_size = to_chunk_size(current_chunk.size + current_chunk.sep_size + member_size)
+        if test_size > max_tokens and has_content:
+            chunks.append({
+                "content": current_chunk.text(),
+                "start_line": current_start,
+                "end_line": current_end,
+                "chunk_type": "class_part",
+                "name": name
+            })
+            current_chunk.parts = [header + continued.rstrip("\n")]
+            current_chunk.size = header_size + piece_size(continued)
+            has_content = False
+
+        if to_chunk_size(header_size + piece_size(continued) + member_size) > max_tokens:
+            # split the member on its own so every piece keeps its real line range
+            chunks.extend(split_member_lines(lines, member_start, member_end, name, max_tokens))
+            continue
+        if not has_content:
+            current_start = member_start + 1
+        current_chunk.parts.append(member_code)
+        current_chunk.size += current_chunk.sep_size + member_size
+        current_end = member_end
+        has_content = True
+
+    if has_content:
+        chunks.append({
+            "content": current_chunk.text(),
+            "start_line": current_start,
+            "end_line": current_end,
+            "chunk_type": "class_part" if len(chunks) > 0 else "class",
+            "name": name
+        })
+    return chunks
+
+def chunk_code_syntax(content, file_ext, max_tokens=500):
+    """Function/class level chunks for languages with a tree-sitter grammar.
+
+    Produces the same chunk layout as chunk_python_code and falls back to
+    chunk_by_lines when the grammar package is not installed.
+    """
+    parser = _get_syntax_parser(file_ext)
+    if parser is None:
+        return chunk_by_lines(content, max_tokens)
+
+    source = content.encode('utf-8')
+    cache_key = (SYNTAX_GRAMMARS[file_ext], hashlib.sha256(source).hexdigest())
+    tree = syntax_tree_cache.get(cache_key)
+    if tree is None:
+        tree = parser.parse(source)
+        syntax_tree_cache.put(cache_key, tree)
+
+    chunks = []
+    lines = content.split("\n")
+    comment_prefix = "#" if file_ext == '.rb' else "//"
+    covered_ranges = []
+
+    for node in tree.root_node.named_children:
+        found = _syntax_definition(node)
+        if found is None:
+            continue
+        def_node, kind = found
+        name = _syntax_node_name(def_node)
+        start_line = node.start_point.row
+        end_line = _syntax_end_row(node) + 1
+        covered_ranges.append((start_line, end_line))
+        chunk_code = extract_code_segment(lines, start_line, end_line)
+
+        if kind == 'class' and get_chunk_size(chunk_code) > max_tokens:
+            chunks.extend(split_large_definition(node, def_node, name, lines, max_tokens, comment_prefix))
+        else:
+            chunks.append({
+                "content": chunk_code,
+                "start_line": start_line + 1,
+                "end_line": end_line,
+                "chunk_type": kind,
+                "name": name
+            })
+
+    chunks.extend(top_level_chunks(lines, covered_ranges, max_tokens))
+    return chunks
+
+
 # Main Router
 class UniversalChunker:
     # Files to skip
     SKIP_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.pdf', '.zip', '.tar', '.gz', '.exe', '.bin'}
     SKIP_DIRS = {'node_modules', '.git', 'dist', 'build', '__pycache__', 'venv', '.venv'}
+    # Machine-written dependency pins, large and of no use for answers
+    LOCKFILES = {
+        'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock', 'Pipfile.lock',
+        'uv.lock', 'Cargo.lock', 'Gemfile.lock', 'composer.lock', 'go.sum', 'packages.lock.json'
+    }
+    # Assets, compiled files and serialized data without useful text
+    ASSET_EXTENSIONS = {
+        '.svg', '.ico', '.map', '.woff', '.woff2', '.ttf', '.otf', '.eot', '.mp3', '.mp4', '.wav', '.webm',
+        '.pyc', '.so', '.dll', '.jar', '.class', '.whl', '.pkl', '.npy', '.npz', '.parquet', '.h5', '.onnx', '.pt'
+    }
+    MINIFIED_SUFFIXES = ('.min.js', '.min.mjs', '.min.css')
+    # files smaller than this are never treated as minified by their line length
+    MINIFIED_MIN_BYTES = 8192
     
-    def __init__(self, max_tokens=500):
+    def __init__(self, max_tokens=500, embedding_model=None, max_file_kb=1024, max_file_lines=20000,
+                 max_line_length=500):
+        # with an embedding model, chunks are sized by its tokenizer and
+        # never exceed the length the model actually encodes
+        self.embedding_model = embedding_model
+        if embedding_model:
+            max_tokens = min(max_tokens, get_model_max_tokens(embedding_model))
         self.max_tokens = max_tokens
+        # pre-filter caps, 0 or None disables one; max_line_length is the
+        # average bytes per line above which a file counts as minified
+        self.max_file_kb = max_file_kb
+        self.max_file_lines = max_file_lines
+        self.max_line_length = max_line_length
+        # (path, reason) of the files the last prefilter call left out
+        self.skipped = []
         if os.getcwd().split('\\')[-1] == 'processing':
             self.root = os.path.abspath('..').replace('\\', '/')
         else:
@@ -315,21 +885,26 @@ class UniversalChunker:
             return []
         
         file_ext = Path(file_path).suffix.lower()
+        if self.embedding_model:
+            # loaded once per worker process
+            set_tokenizer(self.embedding_model)
         
         # Route to appropriate chunker
-        if file_ext == '.py':
+        chunker = self.chunker_name(file_ext)
+        if chunker == 'python':
             chunks = chunk_python_code(content, self.max_tokens)
-        elif file_ext in {'.md', '.markdown'}:
+        elif chunker == 'markdown':
             chunks = chunk_markdown(content, self.max_tokens)
-        elif file_ext == '.json':
+        elif chunker == 'json':
             chunks = chunk_json(content, self.max_tokens)
-        elif file_ext in {'.txt', '.log', '.rst'}:
-            chunks = chunk_text(content, self.max_tokens)
-        elif file_ext in {'.js', '.ts', '.java', '.go', '.rs', '.rb', '.php', '.c', '.cpp', '.h'}:
-            # Fallback for code files (replace with tree-sitter if needed)
-            chunks = chunk_by_lines(content, self.max_tokens)
+        elif chunker == 'notebook':
+            chunks = chunk_notebook(content, self.max_tokens)
+        elif chunker == 'syntax':
+            chunks = chunk_code_syntax(content, file_ext, self.max_tokens)
         else:
             chunks = chunk_text(content, self.max_tokens)
+
+        chunks = split_oversized_chunks(chunks, self.max_tokens)
         
         # Add file metadata to each chunk
         for chunk in chunks:
@@ -340,17 +915,121 @@ class UniversalChunker:
             chunk['og_meta'] = org_metadata
         
         return chunks
-    
-    def chunk_directory(self, dir_path: str) -> List[Dict]:
-        """Chunk all files in a directory recursively"""
-        all_chunks = []
 
-        with open(dir_path.split('repo')[0] + '/metadata.json') as f:
-            file_list = json.load(f)
+    def chunker_name(self, file_ext):
+        """Name of the chunker chunk_file routes a file extension to"""
+        if file_ext == '.py':
+            return 'python'
+        if file_ext in {'.md', '.markdown'}:
+            return 'markdown'
+        if file_ext == '.json':
+            return 'json'
+        if file_ext == '.ipynb':
+            return 'notebook'
+        if file_ext in SYNTAX_GRAMMARS:
+            return 'syntax'
+        return 'text'
+
+    def skip_reason(self, file: Dict):
+        """Why a metadata.json entry should not be chunked, None to chunk it"""
+        path = file['path']
+        name = path.rsplit('/', 1)[-1]
+        if file.get('is_binary'):
+            return 'binary'
+        if file.get('ignored'):
+            return 'gitignored'
+        if file.get('generated'):
+            return 'generated'
+        if file.get('vendored'):
+            return 'vendored'
+        if self.should_skip(path):
+            return 'skip_list'
+        if name in self.LOCKFILES:
+            return 'lockfile'
+        if Path(name).suffix.lower() in self.ASSET_EXTENSIONS:
+            return 'asset'
+        if name.lower().endswith(self.MINIFIED_SUFFIXES):
+            return 'minified'
+        if self.chunker_name(Path(name).suffix.lower()) == 'notebook':
+            # the bulk of a notebook is outputs (base64 images...), which chunk_notebook drops
+            return None
+
+        size = file.get('size')
+        if size is None:
+            # metadata.json written before sizes were recorded
+            try:
+                size = os.path.getsize(self.root + '/' + path)
+            except OSError:
+                size = 0
+        if self.max_file_kb and size > self.max_file_kb * 1024:
+            return 'too_large'
+        line_count = file.get('line_count') or 0
+        if self.max_file_lines and line_count > self.max_file_lines:
+            return 'too_many_lines'
+        if self.max_line_length and size >= self.MINIFIED_MIN_BYTES and size / max(line_count, 1) > self.max_line_length:
+            return 'minified'
+        return None
+
+    def prefilter(self, file_list: List[Dict]) -> List[Dict]:
+        """Drop entries not worth chunking, using the hints ingestion stored in metadata.json.
+
+        Binary, .gitignore'd, linguist-generated / linguist-vendored files,
+        lockfiles, assets, minified files and files over the size and line caps
+        are left out. What was skipped and why is kept in self.skipped, and a
+        summary printed and recorded as the prefilter stage.
+        """
+        start = time.perf_counter()
+        kept = []
+        self.skipped = []
         for file in file_list:
+            reason = self.skip_reason(file)
+            if reason is None:
+                kept.append(file)
+            else:
+                self.skipped.append({'path': file['path'], 'reason': reason})
+
+        reasons = {}
+        for entry in self.skipped:
+            reasons[entry['reason']] = reasons.get(entry['reason'], 0) + 1
+        if reasons:
+            summary = ', '.join(f"{reason} {count}" for reason, count in sorted(reasons.items()))
+            print(f"Pre-filter: chunking {len(kept)} of {len(file_list)} files, skipped {summary}")
+        metrics.record_stage('prefilter', time.perf_counter() - start, files=len(file_list), kept=len(kept), skipped=reasons)
+        return kept
+
+    def save_skip_report(self, dir_path: str, replaced_paths=None):
+        """Write the files skipped by the last prefilter call to skipped.json next to metadata.json.
+
+        For an incremental run pass replaced_paths, the files it re-checked or
+        removed: entries of the existing report for any other file are kept.
+        """
+        report_path = dir_path.split('repo')[0] + '/skipped.json'
+        skipped = self.skipped
+        if replaced_paths is not None and os.path.exists(report_path):
+            replaced_paths = set(replaced_paths)
+            with open(report_path, encoding='utf-8') as f:
+                kept = [entry for entry in json.load(f) if entry['path'] not in replaced_paths]
+            skipped = kept + self.skipped
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(skipped, f, ensure_ascii=False, indent=2)
+        return report_path
+
+    def chunk_files(self, file_list: List[Dict]) -> List[Dict]:
+        """Chunk the given metadata.json entries, minus those the pre-filter drops"""
+        all_chunks = []
+        for file in self.prefilter(file_list):
             chunks = self.chunk_file(self.root + '/'+ file['path'], file)
-            
-        
+            all_chunks.extend(chunks)
+        return all_chunks
+
+    def _load_file_list(self, dir_path: str) -> List[Dict]:
+        with open(dir_path.split('repo')[0] + '/metadata.json') as f:
+            return json.load(f)
+
+    def chunk_directory(self, dir_path: str) -> List[Dict]:
+        """Chunk all files in a directory recursively"""
+        file_list = self._load_file_list(dir_path)
+
         # for root, dirs, files in os.walk(dir_path):
         #     # Filter out skip directories
         #     dirs[:] = [d for d in dirs if d not in self.SKIP_DIRS]
@@ -358,114 +1037,450 @@ class UniversalChunker:
         #     for file in files:
         #         file_path = root + '/' + file
         #         chunks = self.chunk_file(file_path)
-            all_chunks.extend(chunks)
-        
-        return all_chunks
+        chunks = self.chunk_files(file_list)
+        self.save_skip_report(dir_path)
+        return chunks
+
+    def iter_chunk_batches(self, file_list: List[Dict], batch_size=256, max_workers=None, progress=None) -> Iterator[List[Dict]]:
+        """Chunk metadata.json entries on a process pool, yielding batches of at most batch_size chunks.
+
+        Only a few files per worker are in flight at any time and batches are
+        yielded as soon as they fill up, so memory stays flat and the consumer
+        can start embedding before chunking has finished. Batches follow file
+        completion order, not metadata order. progress, if given, is called as
+        progress('chunk', files_done, total_files).
+
+        Time spent per chunker and file type is recorded in metrics; the chunk
+        stage reports the workers' summed chunking time, not wall time, which
+        also includes waiting on the consumer. Files the pre-filter drops are
+        never sent to the workers.
+        """
+        file_list = self.prefilter(file_list)
+        max_workers = max_workers or os.cpu_count() or 1
+        max_pending = max_workers * 4
+        files = iter(file_list)
+        batch = []
+        files_done = 0
+        chunk_count = 0
+        chunkers = {}
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = {
+                executor.submit(timed_chunk_file, self.root + '/' + file['path'], file, self.max_tokens, self.embedding_model)
+                for file in islice(files, max_pending)
+            }
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                files_done += len(done)
+                if progress is not None:
+                    progress('chunk', files_done, len(file_list))
+                for future in done:
+                    chunks, chunker, file_ext, seconds = future.result()
+                    metrics.observe('chunk_file_seconds', seconds, chunker=chunker, file_type=file_ext)
+                    metrics.increment('chunks', len(chunks), chunker=chunker, file_type=file_ext)
+                    totals = chunkers.setdefault(chunker, {'files': 0, 'chunks': 0, 'seconds': 0.0})
+                    totals['files'] += 1
+                    totals['chunks'] += len(chunks)
+                    totals['seconds'] += seconds
+                    chunk_count += len(chunks)
+                    batch.extend(chunks)
+                    while len(batch) >= batch_size:
+                        yield batch[:batch_size]
+                        batch = batch[batch_size:]
+                # top up the window with as many files as just finished
+                for file in islice(files, len(done)):
+                    pending.add(executor.submit(
+                        timed_chunk_file, self.root + '/' + file['path'], file, self.max_tokens, self.embedding_model
+                    ))
+
+        if batch:
+            yield batch
+        metrics.record_stage(
+            'chunk',
+            sum(totals['seconds'] for totals in chunkers.values()),
+            files=files_done,
+            chunks=chunk_count,
+            workers=max_workers,
+            chunkers={name: {**totals, 'seconds': round(totals['seconds'], 6)} for name, totals in chunkers.items()}
+        )
+
+    def chunk_directory_stream(self, dir_path: str, batch_size=256, max_workers=None, progress=None) -> Iterator[List[Dict]]:
+        """Streaming version of chunk_directory, see iter_chunk_batches"""
+        file_list = self._load_file_list(dir_path)
+        yield from self.iter_chunk_batches(file_list, batch_size=batch_size, max_workers=max_workers, progress=progress)
+        self.save_skip_report(dir_path)
                 
     
     def _detect_language(self, ext):
         lang_map = {
             '.py': 'python', '.js': 'javascript', '.ts': 'typescript',
+            '.jsx': 'javascript', '.tsx': 'typescript', '.hpp': 'cpp',
             '.java': 'java', '.go': 'go', '.rs': 'rust', '.rb': 'ruby',
             '.php': 'php', '.c': 'c', '.cpp': 'cpp', '.h': 'c',
-            '.md': 'markdown', '.json': 'json', '.txt': 'text'
+            '.md': 'markdown', '.json': 'json', '.txt': 'text', '.ipynb': 'jupyter'
         }
         return lang_map.get(ext, 'unknown')
 
+# one chunker per worker process and settings, built by its first task
+_worker_chunkers = {}
+
+def timed_chunk_file(file_path: str, org_metadata, max_tokens, embedding_model=None):
+    """UniversalChunker.chunk_file plus (chunker name, file extension, seconds spent), for the worker processes.
+
+    Module-level so a task pickles only its arguments, not the submitting
+    chunker and its skipped list.
+    """
+    chunker = _worker_chunkers.get((max_tokens, embedding_model))
+    if chunker is None:
+        # max_tokens is already capped to the model's length, no need to look it up again
+        chunker = UniversalChunker(max_tokens=max_tokens)
+        chunker.embedding_model = embedding_model
+        _worker_chunkers[(max_tokens, embedding_model)] = chunker
+    start = time.perf_counter()
+    chunks = chunker.chunk_file(file_path, org_metadata)
+    file_ext = Path(file_path).suffix.lower()
+    return chunks, chunker.chunker_name(file_ext), file_ext, time.perf_counter() - start
+
 class VectorStore:
-    def __init__(self, collection_name, persist_directory, embedding_model):
-        """Initialize embedding model and ChromaDB client"""
-        # Load embedding model
-        self.model = SentenceTransformer(embedding_model)
+    def __init__(self, collection_name, persist_directory, embedding_model, batch_size=64, queue_depth=2, cache=None,
+                 backend='torch', model_cache='cache/models', hnsw=None):
+        """Initialize embedding model and ChromaDB client.
+
+        hnsw holds the collection's HNSW settings (space, ef_construction,
+        max_neighbors, ef_search); by default they are read from config.ini.
+        """
+        # Shared embedding model (fp32 torch, or an exported ONNX / int8 copy of it),
+        # loaded on first use and reused by every store and chatbot in the process
+        self.embedding_model = embedding_model
+        self.model = get_embedding_model(embedding_model, backend, model_cache)
+        # cache key for vectors produced by this model and backend
+        self.model_key = embedding_model_key(embedding_model, backend)
+        # Optional EmbeddingCache consulted before encoding
+        self.cache = cache
         
-        # Initialize ChromaDB
+        # Initialize ChromaDB, imported on first use to keep startup fast
+        import chromadb
         self.client = chromadb.PersistentClient(path=persist_directory)
         
         # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-        )
+        if hnsw is None:
+            hnsw = hnsw_settings(collection_name)
+        self.collection = open_collection(self.client, collection_name, hnsw)
+        # identifies the collection in the process-wide retrieval cache
+        self.collection_key = (persist_directory, collection_name)
+
+        # Symbol table and BM25 index kept next to the collection
+        self.lexical_index = LexicalIndex(persist_directory + '/lexical.sqlite')
+
+        # Pipelined add_chunks: chunks encoded per batch, finished batches
+        # waiting for the Chroma writer are capped at queue_depth
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+
+        # Recently encoded contents, so identical chunk bodies (vendored
+        # copies, license headers...) are embedded once even without a cache
+        self._recent_embeddings = LRUCache(maxsize=10000)
     
-    def _generate_id(self, chunk) -> str:
-        """Generate unique ID for chunk"""
-        unique_string = f"{chunk['file_path']}_{chunk.get('start_line', 0)}_{chunk.get('end_line', 0)}"
+    def _generate_id(self, chunk, chunk_hash=None) -> str:
+        """Generate unique ID for chunk from its location and content"""
+        chunk_hash = chunk_hash or content_hash(chunk['content'])
+        unique_string = f"{chunk['file_path']}_{chunk.get('start_line', 0)}_{chunk.get('end_line', 0)}_{chunk['chunk_type']}_{chunk_hash}"
         return hashlib.md5(unique_string.encode()).hexdigest()
+
+    def _chunk_metadata(self, chunk, chunk_hash=None) -> Dict:
+        """Metadata stored alongside a chunk (everything except content)"""
+        metadata = {
+            'file_path': chunk['file_path'],
+            'file_name': chunk['file_name'],
+            'file_extension': chunk['file_extension'],
+            'language': chunk['language'],
+            'chunk_type': chunk['chunk_type'],
+            'content_hash': chunk_hash or content_hash(chunk['content']),
+            #'og_meta':chunk['og_meta']
+        }
+        
+        # Add optional fields
+        if 'name' in chunk:
+            metadata['name'] = chunk['name']
+        if 'start_line' in chunk:
+            metadata['start_line'] = chunk['start_line']
+        if 'end_line' in chunk:
+            metadata['end_line'] = chunk['end_line']
+        for key in ('cell_index', 'cell_type', 'cell_outputs'):
+            if key in chunk:
+                metadata[key] = chunk[key]
+        return metadata
+
+    def _rebatch(self, chunk_batches) -> Iterator[List[Dict]]:
+        """Regroup an iterable of chunk lists into lists of exactly batch_size (last may be shorter)"""
+        batch = []
+        for chunks in chunk_batches:
+            batch.extend(chunks)
+            while len(batch) >= self.batch_size:
+                yield batch[:self.batch_size]
+                batch = batch[self.batch_size:]
+        if batch:
+            yield batch
+
+    def _encode(self, documents, keys) -> List[List[float]]:
+        """Encode each distinct content once, reusing cached embeddings where available"""
+        vectors = {}
+        if self.cache is not None:
+            vectors = self.cache.get_many(self.model_key, keys)
+
+        missing = {}
+        for key, doc in zip(keys, documents):
+            if key in vectors or key in missing:
+                continue
+            recent = self._recent_embeddings.get(key)
+            if recent is not None:
+                vectors[key] = recent
+            else:
+                missing[key] = doc
+        if missing:
+            start = time.perf_counter()
+            encoded = self.model.encode(list(missing.values()), batch_size=self.batch_size)
+            seconds = time.perf_counter() - start
+            self._encode_seconds += seconds
+            metrics.observe('embed_batch_seconds', seconds)
+            metrics.observe('embed_batch_size', len(missing))
+            metrics.increment('chunks_embedded', len(missing))
+            new_items = list(zip(missing.keys(), encoded))
+            if self.cache is not None:
+                self.cache.put_many(self.model_key, new_items)
+            for key, vector in new_items:
+                self._recent_embeddings.put(key, vector)
+            vectors.update(new_items)
+        self._encoded_count += len(missing)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def _write_worker(self, write_queue, errors):
+        """Drain encoded batches from write_queue into ChromaDB until a None sentinel"""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            if errors:
+                # an earlier write failed, keep draining so the producer never blocks
+                continue
+            ids, embeddings, documents, metadatas = item
+            try:
+                start = time.perf_counter()
+                # upsert: re-adding a chunk overwrites it instead of failing
+                self.collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=documents,
+                    metadatas=metadatas
+                )
+                self.lexical_index.add(ids, documents, metadatas)
+                seconds = time.perf_counter() - start
+                self._write_seconds += seconds
+                self._write_count += 1
+                metrics.observe('chroma_write_seconds', seconds)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                bump_collection_version(self.collection_key)
+
+    def add_chunk_batches(self, chunk_batches, progress=None):
+        """Embed and store a stream of chunk lists in ChromaDB.
+
+        Chunks are encoded batch_size at a time while a writer thread stores
+        the previous batch, so embedding and Chroma writes overlap and only
+        queue_depth + 1 batches of embeddings are held in memory. progress, if
+        given, is called as progress('embed', chunks_done, None).
+        """
+        write_queue = queue.Queue(maxsize=self.queue_depth)
+        errors = []
+        writer = threading.Thread(target=self._write_worker, args=(write_queue, errors), daemon=True)
+        writer.start()
+
+        total = 0
+        self._encoded_count = 0
+        self._encode_seconds = 0.0
+        self._write_seconds = 0.0
+        self._write_count = 0
+        try:
+            with tqdm(desc="Embedding chunks", unit="chunk") as progress_bar:
+                for batch in self._rebatch(chunk_batches):
+                    documents = [chunk['content'] for chunk in batch]
+                    hashes = [content_hash(doc) for doc in documents]
+                    ids = [self._generate_id(chunk, h) for chunk, h in zip(batch, hashes)]
+                    metadatas = [self._chunk_metadata(chunk, h) for chunk, h in zip(batch, hashes)]
+                    if len(set(ids)) < len(ids):
+                        # same content at the same location twice, upsert rejects repeated ids
+                        keep = sorted({chunk_id: i for i, chunk_id in enumerate(ids)}.values())
+                        ids, documents, hashes, metadatas = (
+                            [values[i] for i in keep] for values in (ids, documents, hashes, metadatas)
+                        )
+
+                    embeddings = self._encode(documents, hashes)
+                    # blocks while the writer is queue_depth batches behind
+                    write_queue.put((ids, embeddings, documents, metadatas))
+                    total += len(batch)
+                    progress_bar.update(len(batch))
+                    if progress is not None:
+                        progress('embed', total, None)
+                    if errors:
+                        break
+        finally:
+            write_queue.put(None)
+            writer.join()
+
+        if errors:
+            raise errors[0]
+        dedup_rate = 1 - self._encoded_count / total if total else 0.0
+        print(f"✓ Stored {total} chunks ({self._encoded_count} embedded, {dedup_rate:.1%} reused)")
+        metrics.record_stage(
+            'embed',
+            self._encode_seconds,
+            chunks=total,
+            encoded=self._encoded_count,
+            batch_size=self.batch_size,
+            chunks_per_sec=round(self._encoded_count / self._encode_seconds, 2) if self._encode_seconds else None
+        )
+        metrics.record_stage('chroma_write', self._write_seconds, chunks=total, writes=self._write_count)
+        if self.cache is not None:
+            print(f"Embedding cache: {self.cache.get_stats()}")
     
     def add_chunks(self, chunks):
         """Embed and store chunks in ChromaDB"""
         if not chunks:
             return
         
-        # Prepare data
-        ids = []
-        documents = []
-        metadatas = []
-        
-        for chunk in chunks:
-            # Generate unique ID
-            chunk_id = self._generate_id(chunk)
-            ids.append(chunk_id)
-            
-            # Content to embed
-            documents.append(chunk['content'])
-            
-            # Metadata (everything except content)
-            metadata = {
-                'file_path': chunk['file_path'],
-                'file_name': chunk['file_name'],
-                'file_extension': chunk['file_extension'],
-                'language': chunk['language'],
-                'chunk_type': chunk['chunk_type'],
-                #'og_meta':chunk['og_meta']
-            }
-            
-            # Add optional fields
-            if 'name' in chunk:
-                metadata['name'] = chunk['name']
-            if 'start_line' in chunk:
-                metadata['start_line'] = chunk['start_line']
-            if 'end_line' in chunk:
-                metadata['end_line'] = chunk['end_line']
-            
-            metadatas.append(metadata)
-        
-        # Generate embeddings
         print(f"Generating embeddings for {len(chunks)} chunks...")
-        embeddings = self.model.encode(documents, show_progress_bar=True)
-        
-        # Store in ChromaDB
-        print("Storing in ChromaDB...")
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings.tolist(),
-            documents=documents,
-            metadatas=metadatas
-        )
-        
-        print(f"✓ Stored {len(chunks)} chunks")
+        self.add_chunk_batches([chunks])
     
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the in-process cache for repeated questions"""
+        key = (self.model_key, query)
+        query_embedding = query_embedding_cache.get(key)
+        if query_embedding is None:
+            query_embedding = self.model.encode([query])[0].tolist()
+            query_embedding_cache.put(key, query_embedding)
+        return query_embedding
+
+    def set_search_ef(self, ef_search):
+        """Store a new HNSW candidate list size for queries: lower is faster, higher recalls more.
+
+        Chroma applies it when it next loads the index, i.e. once every client
+        of persist_directory in the process was closed, or on the next start.
+        """
+        self.collection.modify(configuration={'hnsw': {'ef_search': ef_search}})
+        # cached results were found with the old setting
+        bump_collection_version(self.collection_key)
+
+    def cache_version(self):
+        """Retrieval cache version, changed by writes from this or any other process"""
+        return get_collection_version(self.collection_key), self.lexical_index.version()
+
     def search(self, query: str, n_results=5, filters=None):
         """Search for similar code chunks"""
+        cache_key = (
+            self.collection_key,
+            self.cache_version(),
+            query,
+            json.dumps(filters, sort_keys=True),
+            n_results
+        )
+        results = retrieval_cache.get(cache_key)
+        if results is not None:
+            return copy.deepcopy(results)
+
         # Generate query embedding
-        query_embedding = self.model.encode([query])[0]
+        query_embedding = self.embed_query(query)
         
         # Search in ChromaDB
         results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],
+            query_embeddings=[query_embedding],
             n_results=n_results,
             where=filters  # e.g., {"language": "python"}
         )
+        retrieval_cache.put(cache_key, copy.deepcopy(results))
         
         return results
     
     
-    def get_collection_stats(self):
-        """Get statistics about stored chunks"""
+    def hybrid_search(self, query: str, n_results=5, filters=None):
+        """Search combining exact symbol lookups, BM25 and vector similarity.
+
+        Chunks defining an identifier named in the query (see identifiers_in),
+        BM25 and vector rankings are merged with reciprocal rank fusion, so a
+        definition ranks first when the other rankings agree and never
+        crowds them out. Results use the same nested-list layout as
+        collection.query, with 'scores' instead of 'distances'.
+        """
+        symbol_hits = self.lexical_index.lookup_symbols(identifiers_in(query), filters)
+        vector_results = self.search(query, n_results=n_results * 2, filters=filters)
+        lexical_hits = self.lexical_index.search(query, n_results=n_results * 2, filters=filters)
+
+        documents = {hit['id']: (hit['document'], hit['metadata']) for hit in symbol_hits + lexical_hits}
+        for chunk_id, document, metadata in zip(
+            vector_results['ids'][0], vector_results['documents'][0], vector_results['metadatas'][0]
+        ):
+            documents[chunk_id] = (document, metadata)
+
+        fused = reciprocal_rank_fusion([
+            [hit['id'] for hit in symbol_hits],
+            vector_results['ids'][0],
+            [hit['id'] for hit in lexical_hits]
+        ])[:n_results]
+        return {
+            "ids": [[chunk_id for chunk_id, _ in fused]],
+            "documents": [[documents[chunk_id][0] for chunk_id, _ in fused]],
+            "metadatas": [[documents[chunk_id][1] for chunk_id, _ in fused]],
+            "scores": [[score for _, score in fused]]
+        }
+
+    def delete_files(self, file_paths):
+        """Delete all chunks belonging to the given file paths"""
+        file_paths = list(file_paths)
+        if not file_paths:
+            return
+        self.collection.delete(where={"file_path": {"$in": file_paths}})
+        self.lexical_index.delete_files(file_paths)
+        bump_collection_version(self.collection_key)
+        print(f"✓ Deleted chunks of {len(file_paths)} files")
+
+    def clear(self, page_size=5000):
+        """Delete every chunk, keeping the collection (and open handles to it) and its HNSW settings"""
+        while True:
+            ids = self.collection.get(include=[], limit=page_size)['ids']
+            if not ids:
+                break
+            self.collection.delete(ids=ids)
+        self.lexical_index.clear()
+        bump_collection_version(self.collection_key)
+
+    def get_collection_stats(self, page_size=5000):
+        """Get statistics about stored chunks, from counters kept up to date on every write"""
         count = self.collection.count()
+        indexed, unique_contents = self.lexical_index.content_stats()
+        if indexed != count:
+            # collection written before its lexical index existed, count by scanning it
+            unique_contents = self._scan_unique_contents(count, page_size)
+
         return {
             "total_chunks": count,
+            "unique_contents": unique_contents,
+            "dedup_rate": 1 - unique_contents / count if count else 0.0,
             "collection_name": self.collection.name
         }
+
+    def _scan_unique_contents(self, count, page_size):
+        """Distinct chunk bodies, paging through all metadata; chunks stored before content hashes count as unique"""
+        unique_hashes = set()
+        unhashed = 0
+        for offset in range(0, count, page_size):
+            page = self.collection.get(include=['metadatas'], limit=page_size, offset=offset)
+            for metadata in page['metadatas']:
+                if metadata.get('content_hash'):
+                    unique_hashes.add(metadata['content_hash'])
+                else:
+                    unhashed += 1
+        return len(unique_hashes) + unhashed
     
     
 if __name__ == "__main__":
@@ -478,7 +1493,8 @@ if __name__ == "__main__":
     configur.read('config.ini')
 
     embedding_model = configur['config'].get('emebdding_model')
-    store = VectorStore(collection_name="my_repo", persist_directory='test_db', embedding_model = embedding_model)
+    store = VectorStore(collection_name="my_repo", persist_directory='test_db', embedding_model = embedding_model,
+                        backend=configur['config'].get('embedding_backend', 'torch'))
     store.add_chunks(chunks[:100])
     stats = store.get_collection_stats()
     print(f"\nCollection stats: {stats}")
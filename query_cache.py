@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with hit/miss counters"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize
+        }
+
+
+# Query embeddings keyed by (model name, query text), shared by indexing and chat
+query_embedding_cache = LRUCache(maxsize=4096)
+
+# Search results keyed by (collection, collection version, query, filters, k)
+retrieval_cache = LRUCache(maxsize=1024)
+
+
+# Bumped whenever a collection is written to in this process; part of the
+# retrieval cache key together with the lexical index's write_version, which
+# also sees writes made by other processes
+_collection_versions = {}
+_versions_lock = threading.Lock()
+
+
+def get_collection_version(collection_key):
+    with _versions_lock:
+        return _collection_versions.get(collection_key, 0)
+
+
+def bump_collection_version(collection_key):
+    """Invalidate cached retrieval results of a modified collection"""
+    with _versions_lock:
+        _collection_versions[collection_key] = _collection_versions.get(collection_key, 0) + 1
+
+
+def get_cache_stats():
+    """Hit/miss counters of the process-wide query caches"""
+    return {
+        "query_embeddings": query_embedding_cache.get_stats(),
+        "retrieval": retrieval_cache.get_stats()
+    }
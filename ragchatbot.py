@@ -1,40 +1,218 @@
 import os
-import chromadb
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+import time
+from typing import Any
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core import Settings, VectorStoreIndex, StorageContext
-from llama_index.llms.google_genai import GoogleGenAI
+from llama_index.core.bridge.pydantic import PrivateAttr
 from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.chat_engine import CondensePlusContextChatEngine
 from configparser import ConfigParser
 from dotenv import load_dotenv
+from query_cache import query_embedding_cache, retrieval_cache, get_collection_version, get_cache_stats
+from embedding_backend import embedding_model_key
+from model_registry import get_embedding_model
+from lexical_index import LexicalIndex, identifiers_in, reciprocal_rank_fusion
+from hnsw_config import hnsw_settings, open_collection
+import metrics
+
+
+class SharedEmbedding(BaseEmbedding):
+    """llama_index embedding backed by the process-wide model registry.
+
+    Encodes exactly like VectorStore and shares its query embedding cache, so
+    indexing and chatting use one loaded model and one set of cached queries.
+    """
+    _model: Any = PrivateAttr()
+    _cache_key: str = PrivateAttr()
+
+    def __init__(self, model_name, backend='torch', model_cache='cache/models', **kwargs):
+        super().__init__(model_name=model_name, **kwargs)
+        self._model = get_embedding_model(model_name, backend, model_cache)
+        self._cache_key = embedding_model_key(model_name, backend)
+
+    def _get_query_embedding(self, query):
+        key = (self._cache_key, query)
+        embedding = query_embedding_cache.get(key)
+        if embedding is None:
+            embedding = self._model.encode([query])[0].tolist()
+            query_embedding_cache.put(key, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text):
+        return self._model.encode([text])[0].tolist()
+
+    def _get_text_embeddings(self, texts):
+        return self._model.encode(texts).tolist()
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    async def _aget_text_embedding(self, text):
+        return self._get_text_embedding(text)
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever fusing symbol-table hits for identifiers in the question
+    with BM25 and vector results"""
+
+    def __init__(self, vector_retriever, lexical_index, similarity_top_k=5):
+        self.vector_retriever = vector_retriever
+        self.lexical_index = lexical_index
+        self.similarity_top_k = similarity_top_k
+        super().__init__()
+
+    def _retrieve(self, query_bundle):
+        query = query_bundle.query_str
+
+        # definitions of named identifiers are one more ranking, they never replace the others
+        symbol_hits = self.lexical_index.lookup_symbols(identifiers_in(query))
+        vector_nodes = self.vector_retriever.retrieve(query_bundle)
+        lexical_hits = self.lexical_index.search(query, n_results=self.similarity_top_k)
+
+        nodes = {
+            hit['id']: TextNode(id_=hit['id'], text=hit['document'], metadata=hit['metadata'])
+            for hit in symbol_hits + lexical_hits
+        }
+        for node_with_score in vector_nodes:
+            nodes[node_with_score.node.node_id] = node_with_score.node
+
+        fused = reciprocal_rank_fusion([
+            [hit['id'] for hit in symbol_hits],
+            [node_with_score.node.node_id for node_with_score in vector_nodes],
+            [hit['id'] for hit in lexical_hits]
+        ])[:self.similarity_top_k]
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused]
+
+
+class CachedRetriever(BaseRetriever):
+    """Serves repeated questions from the process-wide retrieval cache.
+
+    Results are keyed by cache_key, the query and version_fn(), which must
+    change whenever the underlying collection is written to.
+    """
+
+    def __init__(self, retriever, cache_key, version_fn):
+        self.retriever = retriever
+        self.cache_key = cache_key
+        self.version_fn = version_fn
+        super().__init__()
+
+    def _retrieve(self, query_bundle):
+        key = (self.cache_key, self.version_fn(), query_bundle.query_str)
+        cached = retrieval_cache.get(key)
+        if cached is not None:
+            return [
+                NodeWithScore(node=TextNode(id_=node_id, text=text, metadata=dict(metadata)), score=score)
+                for node_id, text, metadata, score in cached
+            ]
+        nodes = self.retriever.retrieve(query_bundle)
+        retrieval_cache.put(key, [
+            (node.node.node_id, node.node.get_content(), dict(node.node.metadata), node.score) for node in nodes
+        ])
+        return nodes
+
+
+class FederatedRetriever(BaseRetriever):
+    """Retriever over every registered repo, backed by FederatedSearch"""
+
+    def __init__(self, federated_search, similarity_top_k=5, repos=None, filters=None, repo_filters=None):
+        self.federated_search = federated_search
+        self.similarity_top_k = similarity_top_k
+        self.repos = repos
+        self.filters = filters
+        self.repo_filters = repo_filters
+        super().__init__()
+
+    def _retrieve(self, query_bundle):
+        hits = self.federated_search.search(
+            query_bundle.query_str,
+            n_results=self.similarity_top_k,
+            repos=self.repos,
+            filters=self.filters,
+            repo_filters=self.repo_filters
+        )
+        return [
+            NodeWithScore(
+                node=TextNode(id_=f"{hit['repo']}:{hit['id']}", text=hit['document'], metadata={**hit['metadata'], 'repo': hit['repo']}),
+                score=hit['score']
+            )
+            for hit in hits
+        ]
+
+
+class TimedChatEngine(CondensePlusContextChatEngine):
+    """CondensePlusContextChatEngine that keeps the condense and retrieval times of the last turn"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_timings = {}
+
+    def _condense_question(self, chat_history, latest_message):
+        start = time.perf_counter()
+        question = super()._condense_question(chat_history, latest_message)
+        self.last_timings['condense'] = time.perf_counter() - start
+        return question
+
+    def _get_nodes(self, message):
+        start = time.perf_counter()
+        nodes = super()._get_nodes(message)
+        self.last_timings['retrieve'] = time.perf_counter() - start
+        return nodes
 
 
 class RAGChatbot:
-    def __init__(self, chroma_path, collection_name, google_api_key=None, config_file='config.ini'):
-        """Initialize RAG chatbot with vector store and LLM"""
-        
-        # Setup ChromaDB
-        self.client = chromadb.PersistentClient(path=chroma_path)
-        self.collection = self.client.get_or_create_collection(name=collection_name)
-        vector_store = ChromaVectorStore(self.collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        
-        # Setup LLM
+    def __init__(self, chroma_path=None, collection_name=None, google_api_key=None, config_file='config.ini', llm=None,
+                 retriever=None):
+        """Initialize RAG chatbot with vector store and LLM (Gemini unless an llm is passed in).
+
+        Pass a retriever (e.g. FederatedRetriever) instead of chroma_path and
+        collection_name to chat over something other than a single repo.
+        """
         
         # Setup embedding model
         configur = ConfigParser()
         configur.read(config_file)
         embedding_model = configur['config'].get('emebdding_model', 'all-mpnet-base-v2')
-        Settings.embed_model = HuggingFaceEmbedding(model_name=embedding_model)
-
-        llm = GoogleGenAI(
-            model=configur['config']['chat_model'],
-            api_key=os.environ.get("GOOGLE_API_KEY"),
-            temperature=configur['config'].getfloat('temperature', 0.25),
-            max_output_tokens=configur['config'].getint('max_output_tokens', 1024),
-            sync_mode=True,
+        # weights are loaded once per process and reused across repos
+        Settings.embed_model = SharedEmbedding(
+            model_name=embedding_model,
+            backend=configur['config'].get('embedding_backend', 'torch'),
+            model_cache=configur['files'].get('model_cache', 'cache/models')
         )
+
+        # Setup LLM
+        if llm is None:
+            from llama_index.llms.google_genai import GoogleGenAI
+            llm = GoogleGenAI(
+                model=configur['config']['chat_model'],
+                api_key=os.environ.get("GOOGLE_API_KEY"),
+                temperature=configur['config'].getfloat('temperature', 0.25),
+                max_output_tokens=configur['config'].getint('max_output_tokens', 1024),
+                sync_mode=True,
+            )
         Settings.llm = llm
+
+        self.client = None
+        self.collection = None
+        self.lexical_index = None
+        if retriever is not None:
+            self.chat_engine = TimedChatEngine.from_defaults(
+                retriever=retriever,
+                memory=ChatMemoryBuffer.from_defaults(token_limit=3000),
+                llm=llm
+            )
+            self.chat_history = []
+            return
+        
+        # Setup ChromaDB; only single-repo chatbots need the Chroma integration
+        import chromadb
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+        self.client = chromadb.PersistentClient(path=chroma_path)
+        self.collection = open_collection(self.client, collection_name, hnsw_settings(collection_name, config_file))
+        vector_store = ChromaVectorStore(self.collection)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
         
         # Create index and query engine with memory
         index = VectorStoreIndex.from_vector_store(
@@ -43,18 +221,59 @@ class RAGChatbot:
         )
         
         # Create chat engine with memory
-        self.chat_engine = index.as_chat_engine(
-            chat_mode="condense_plus_context",
+        # same key as the repo's VectorStore, so writes in this process invalidate both
+        collection_key = (chroma_path, collection_name)
+        lexical_path = chroma_path + '/lexical.sqlite'
+        if os.path.exists(lexical_path):
+            self.lexical_index = LexicalIndex(lexical_path)
+            retriever = CachedRetriever(
+                HybridRetriever(
+                    vector_retriever=index.as_retriever(similarity_top_k=5),
+                    lexical_index=self.lexical_index,
+                    similarity_top_k=5
+                ),
+                cache_key=(collection_key, 'hybrid', 5),
+                version_fn=lambda: (get_collection_version(collection_key), self.lexical_index.version())
+            )
+        else:
+            # repos onboarded before the lexical index existed; without its write
+            # counter, the chunk count is what reveals a refresh by another process
+            retriever = CachedRetriever(
+                index.as_retriever(similarity_top_k=5),
+                cache_key=(collection_key, 'vector', 5),
+                version_fn=lambda: (get_collection_version(collection_key), self.collection.count())
+            )
+        self.chat_engine = TimedChatEngine.from_defaults(
+            retriever=retriever,
             memory=ChatMemoryBuffer.from_defaults(token_limit=3000),
-            similarity_top_k=5,
             llm=llm
         )
         
         self.chat_history = []
     
+    def _record_timings(self, start, first_token=None):
+        """Record condense, retrieval and LLM latency of the turn that started at start"""
+        total = time.perf_counter() - start
+        timings = dict(self.chat_engine.last_timings)
+        timings['llm'] = total - timings.get('condense', 0.0) - timings.get('retrieve', 0.0)
+        for step, seconds in timings.items():
+            metrics.observe('chat_seconds', seconds, step=step)
+        metrics.observe('chat_seconds', total, step='total')
+        if first_token is not None:
+            metrics.observe('chat_seconds', first_token, step='first_token')
+        metrics.emit(
+            'chat',
+            total=round(total, 6),
+            first_token=round(first_token, 6) if first_token is not None else None,
+            **{step: round(seconds, 6) for step, seconds in timings.items()}
+        )
+
     def chat(self, message):
         """Send a message and get response"""
+        start = time.perf_counter()
+        self.chat_engine.last_timings = {}
         response = self.chat_engine.chat(message)
+        self._record_timings(start)
         
         # Store in history
         self.chat_history.append({
@@ -63,6 +282,26 @@ class RAGChatbot:
         })
         
         return str(response)
+
+    def stream_chat(self, message):
+        """Send a message and yield the response tokens as the LLM produces them"""
+        start = time.perf_counter()
+        self.chat_engine.last_timings = {}
+        response = self.chat_engine.stream_chat(message)
+        tokens = []
+        first_token = None
+        for token in response.response_gen:
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            tokens.append(token)
+            yield token
+        self._record_timings(start, first_token)
+
+        # Store in history once the full answer is known
+        self.chat_history.append({
+            "user": message,
+            "assistant": ''.join(tokens)
+        })
     
     def reset(self):
         """Reset chat memory"""
@@ -72,6 +311,18 @@ class RAGChatbot:
     def get_history(self):
         """Get chat history"""
         return self.chat_history
+
+    def get_cache_stats(self):
+        """Hit/miss counters of the query embedding and retrieval caches"""
+        return get_cache_stats()
+
+    def close(self):
+        """Release the Chroma client and lexical index held by this chatbot"""
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        # older chromadb clients have no close and are released on garbage collection
+        if self.client is not None and hasattr(self.client, 'close'):
+            self.client.close()
     
     def start_chat(self):
         """Start interactive chat session"""
@@ -139,8 +390,10 @@ class RAGChatbot:
             if not user_input:
                 continue
             
-            response = self.chat(user_input)
-            print(f"\nAssistant:\n {response}\n")
+            print("\nAssistant:\n ", end='', flush=True)
+            for token in self.stream_chat(user_input):
+                print(token, end='', flush=True)
+            print("\n")
 
 # Example usage in script
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+REGISTRY_COLUMNS = (
+    'name', 'url', 'collection_name', 'local_path', 'collection_path', 'processed_date',
+    'status', 'chunk_count', 'embedding_model', 'last_commit', 'updated_at'
+)
+
+
+class RepoRegistry:
+    """Registry of onboarded repos backed by SQLite in WAL mode.
+
+    Entries are looked up by name or URL through indexes instead of scanning
+    a JSON file, each change is a single transaction, and several processes
+    can share the file. An existing processed_repos.json is imported once;
+    the import is recorded in the migrations table and the file left as is.
+    """
+
+    def __init__(self, path='registry.sqlite', legacy_json=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS repos (
+                name TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                collection_name TEXT NOT NULL,
+                local_path TEXT,
+                collection_path TEXT NOT NULL,
+                processed_date TEXT,
+                status TEXT NOT NULL,
+                chunk_count INTEGER,
+                embedding_model TEXT,
+                last_commit TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_repos_url ON repos(url)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS migrations (
+                source TEXT PRIMARY KEY,
+                migrated_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+        if legacy_json:
+            self.migrate_json(legacy_json)
+
+    def migrate_json(self, json_path):
+        """Import entries of a processed_repos.json, only the first time it is seen"""
+        source = os.path.abspath(json_path)
+        if not os.path.exists(json_path):
+            return 0
+        with self._lock:
+            if self.conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+                return 0
+        with open(json_path, 'r') as f:
+            entries = json.load(f)
+        with self._lock:
+            for name, info in entries.items():
+                self.conn.execute(
+                    """INSERT OR IGNORE INTO repos
+                       (name, url, collection_name, local_path, collection_path, processed_date, status, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (name, info['url'], info['collection_name'], info.get('local_path'),
+                     info.get('collection_path', 'chromadb/' + name), info.get('processed_date'),
+                     info.get('status', 'Embedded'), time.time())
+                )
+            self.conn.execute("INSERT OR IGNORE INTO migrations (source, migrated_at) VALUES (?, ?)", (source, time.time()))
+            self.conn.commit()
+        print(f"Migrated {len(entries)} repos from {json_path} to {self.path}")
+        return len(entries)
+
+    def _rows_to_entries(self, rows):
+        return [dict(zip(REGISTRY_COLUMNS, row)) for row in rows]
+
+    def _select(self, where='', params=()):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(REGISTRY_COLUMNS)} FROM repos {where}", params
+            ).fetchall()
+        return self._rows_to_entries(rows)
+
+    def get(self, name):
+        """Entry of a repo by name, None if unknown"""
+        entries = self._select("WHERE name = ?", (name,))
+        return entries[0] if entries else None
+
+    def find_by_url(self, url):
+        """Entry of a repo by clone URL, None if unknown"""
+        entries = self._select("WHERE url = ?", (url,))
+        return entries[0] if entries else None
+
+    def list_repos(self, status=None):
+        """All entries ordered by name, optionally only those with the given status"""
+        if status is None:
+            return self._select("ORDER BY name")
+        return self._select("WHERE status = ? ORDER BY name", (status,))
+
+    def names(self, status='Embedded'):
+        return [entry['name'] for entry in self.list_repos(status)]
+
+    def upsert(self, name, url, collection_name, local_path, collection_path, status):
+        """Create or replace a repo's location and status, keeping its stats"""
+        with self._lock:
+            self.conn.execute(
+                """INSERT INTO repos
+                   (name, url, collection_name, local_path, collection_path, processed_date, status, updated_at)
+                   VALUES (?, ?, ?, ?, ?, date('now', 'localtime'), ?, ?)
+                   ON CONFLICT(name) DO UPDATE SET
+                       url = excluded.url,
+                       collection_name = excluded.collection_name,
+                       local_path = excluded.local_path,
+                       collection_path = excluded.collection_path,
+                       status = excluded.status,
+                       updated_at = excluded.updated_at""",
+                (name, url, collection_name, local_path, collection_path, status, time.time())
+            )
+            self.conn.commit()
+
+    def claim(self, name, url, collection_name, local_path, collection_path, stale_after=None):
+        """Atomically register a repo as 'Processing' before it is ingested.
+
+        Succeeds for a new repo, one whose last onboarding failed and, with
+        stale_after, one left in 'Processing' for longer than stale_after
+        seconds by a crashed run. Returns False when another onboarding holds
+        the repo or it is already embedded.
+        """
+        now = time.time()
+        takeover = "repos.status = 'Failed'"
+        params = [name, url, collection_name, local_path, collection_path, now]
+        if stale_after is not None:
+            takeover += " OR (repos.status = 'Processing' AND repos.updated_at < ?)"
+            params.append(now - stale_after)
+        with self._lock:
+            changed = self.conn.execute(
+                f"""INSERT INTO repos
+                   (name, url, collection_name, local_path, collection_path, processed_date, status, updated_at)
+                   VALUES (?, ?, ?, ?, ?, date('now', 'localtime'), 'Processing', ?)
+                   ON CONFLICT(name) DO UPDATE SET
+                       url = excluded.url,
+                       collection_name = excluded.collection_name,
+                       local_path = excluded.local_path,
+                       collection_path = excluded.collection_path,
+                       status = excluded.status,
+                       updated_at = excluded.updated_at
+                   WHERE {takeover}""",
+                params
+            ).rowcount
+            self.conn.commit()
+        return changed == 1
+
+    def set_status(self, name, status, expected=None):
+        """Atomically move a repo to status, only from one of the expected statuses if given.
+
+        Returns False when the repo is unknown or in another status.
+        """
+        query = "UPDATE repos SET status = ?, updated_at = ? WHERE name = ?"
+        params = [status, time.time(), name]
+        if expected is not None:
+            expected = [expected] if isinstance(expected, str) else list(expected)
+            query += f" AND status IN ({','.join('?' * len(expected))})"
+            params.extend(expected)
+        with self._lock:
+            changed = self.conn.execute(query, params).rowcount
+            self.conn.commit()
+        return changed == 1
+
+    def update_stats(self, name, chunk_count=None, embedding_model=None, last_commit=None):
+        """Record indexing stats after a repo was embedded or refreshed"""
+        with self._lock:
+            self.conn.execute(
+                """UPDATE repos SET
+                       chunk_count = COALESCE(?, chunk_count),
+                       embedding_model = COALESCE(?, embedding_model),
+                       last_commit = COALESCE(?, last_commit),
+                       processed_date = date('now', 'localtime'),
+                       updated_at = ?
+                   WHERE name = ?""",
+                (chunk_count, embedding_model, last_commit, time.time(), name)
+            )
+            self.conn.commit()
+
+    def remove(self, name):
+        with self._lock:
+            self.conn.execute("DELETE FROM repos WHERE name = ?", (name,))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()